@@ -0,0 +1,64 @@
+"""Benchmarks duplicate-task lookup latency at different index sizes.
+
+Usage: python scripts/bench_dedup.py [--sizes 10000 50000 100000] [--queries 200]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.context.similarity import TaskIndex, create_embedder
+
+WORDS = (
+    "please check the report deploy server invoice meeting tomorrow update "
+    "budget review contract customer ticket login error release notes slides "
+    "send confirm schedule payment refund order database backup migrate"
+).split()
+
+
+def random_message(rng: random.Random) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 20)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 50_000, 100_000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--embedder", default="hashing")
+    parser.add_argument("--dim", type=int, default=512)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    embedder = create_embedder(args.embedder, args.dim, 3)
+    queries = [random_message(rng) for _ in range(args.queries)]
+
+    print(f"{'tasks':>8} {'embed ms':>9} {'search p50 ms':>14} {'search p99 ms':>14} {'index MB':>9}")
+    for size in args.sizes:
+        index = TaskIndex(embedder)
+        for task_id in range(size):
+            index.add(task_id, random_message(rng))
+
+        embed_times, search_times = [], []
+        for text in queries:
+            start = time.perf_counter()
+            vector = embedder.embed(text)
+            embed_times.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            index.search_vector(vector)
+            search_times.append(time.perf_counter() - start)
+
+        search_times.sort()
+        p99 = search_times[min(len(search_times) - 1, int(len(search_times) * 0.99))]
+        print(
+            f"{size:>8} {statistics.mean(embed_times) * 1000:>9.3f} "
+            f"{statistics.median(search_times) * 1000:>14.3f} {p99 * 1000:>14.3f} "
+            f"{size * args.dim * 4 / 1e6:>9.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
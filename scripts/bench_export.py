@@ -0,0 +1,80 @@
+"""Measures memory and throughput of the streaming task export.
+
+Builds a temporary SQLite database with N tasks (a mix of pending and done),
+exports it as gzip CSV and JSONL, and reports the tracemalloc peak, wall time
+and file size of each. Peak memory should stay flat as --tasks grows.
+
+Usage: python scripts/bench_export.py [--tasks 1000000] [--content-size 200] [--no-trace]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.context import database
+from src.context import export
+from src.context.sqlite_store import SQLiteTaskStore
+
+
+def populate(path: str, count: int, content_size: int):
+    rng = random.Random(0)
+    alphabet = "abcdefghijklmnopqrstuvwxyz     "
+    conn = sqlite3.connect(path)
+    SQLiteTaskStore._init(conn)
+    start = 1_700_000_000
+    conn.executemany(
+        "INSERT INTO tasks (source, chat_id, message_id, sender, content, detected_at, completed_at, status, tags, "
+        "detected_ts, completed_ts) VALUES ('telegram', ?, ?, ?, ?, '2024-01-01T09:00:00', ?, ?, '', ?, ?)",
+        (
+            (-1000 - i % 50, i, f"user{i % 200}", "".join(rng.choices(alphabet, k=content_size)),
+             "2024-01-02T09:00:00" if i % 3 else None, "done" if i % 3 else "new",
+             start + i * 60, start + i * 60 + 3600 if i % 3 else None)
+            for i in range(count)
+        ),
+    )
+    conn.commit()
+    conn.close()
+
+
+async def measure(path: str, kind: str, fmt: str, trace: bool):
+    if trace:
+        tracemalloc.start()
+    started = time.perf_counter()
+    rows = await export.export_tasks(path, kind, fmt)
+    elapsed = time.perf_counter() - started
+    peak = 0
+    if trace:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    print(f"{kind + ' ' + fmt:<16} {rows:>9} {peak / 1e6:>9.1f} {elapsed:>8.1f} {rows / elapsed:>10.0f} "
+          f"{os.path.getsize(path) / 1e6:>8.1f}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tasks", type=int, default=1_000_000)
+    parser.add_argument("--content-size", type=int, default=200)
+    parser.add_argument("--no-trace", action="store_true", help="skip tracemalloc, which slows the export several times")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        print(f"Populating {args.tasks} tasks...")
+        populate(db_path, args.tasks, args.content_size)
+        database.set_store(SQLiteTaskStore(db_path))
+        await database.init_db()
+        print(f"{'export':<16} {'rows':>9} {'peak MB':>9} {'secs':>8} {'rows/s':>10} {'file MB':>8}")
+        for kind, fmt in (("all", "csv"), ("all", "jsonl"), ("completed", "csv")):
+            await measure(os.path.join(tmp, f"out.{fmt}.gz"), kind, fmt, not args.no_trace)
+        await database.close_db()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,85 @@
+"""Compares peak memory of list rendering with fetchall() dicts vs. streamed summaries.
+
+Builds a temporary SQLite database with N pending tasks, then renders the
+/tasks list three ways and reports the tracemalloc peak and wall time of each.
+
+Usage: python scripts/bench_memory.py [--tasks 100000] [--content-size 400]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.context.sqlite_store import SQLiteTaskStore
+
+
+def populate(path: str, count: int, content_size: int):
+    rng = random.Random(0)
+    alphabet = "abcdefghijklmnopqrstuvwxyz     "
+    conn = sqlite3.connect(path)
+    SQLiteTaskStore._init(conn)
+    conn.executemany(
+        "INSERT INTO tasks (source, chat_id, message_id, sender, content, detected_at, status, tags) "
+        "VALUES ('telegram', ?, ?, ?, ?, '2024-01-01T09:00:00', 'new', '')",
+        (
+            (-1000 - i % 50, i, f"user{i % 200}", "".join(rng.choice(alphabet) for _ in range(content_size)))
+            for i in range(count)
+        ),
+    )
+    conn.commit()
+    conn.close()
+
+
+async def render_fetchall(store: SQLiteTaskStore) -> int:
+    tasks = await store.get_pending_tasks()
+    lines = [f"(ID: {t['id']}) [{t['sender']}] {t['content'][:50]}..." for t in tasks]
+    return len(lines)
+
+
+async def render_tasks(store: SQLiteTaskStore) -> int:
+    lines = [f"(ID: {t.id}) [{t.sender}] {t.content[:50]}..." async for t in store.iter_pending_tasks()]
+    return len(lines)
+
+
+async def render_summaries(store: SQLiteTaskStore) -> int:
+    lines = [f"(ID: {t.id}) [{t.sender}] {t.preview}..." async for t in store.iter_pending_summaries(50)]
+    return len(lines)
+
+
+async def measure(name: str, store: SQLiteTaskStore, func):
+    tracemalloc.start()
+    started = time.perf_counter()
+    count = await func(store)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:<32} {count:>8} {peak / 1e6:>10.1f} {elapsed:>8.2f}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tasks", type=int, default=100_000)
+    parser.add_argument("--content-size", type=int, default=400)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        populate(path, args.tasks, args.content_size)
+        store = SQLiteTaskStore(path)
+        await store.init()
+        print(f"{'variant':<32} {'rows':>8} {'peak MB':>10} {'secs':>8}")
+        await measure("fetchall() + dicts (before)", store, render_fetchall)
+        await measure("iter_pending_tasks (Task)", store, render_tasks)
+        await measure("iter_pending_summaries", store, render_summaries)
+        await store.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
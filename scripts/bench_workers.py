@@ -0,0 +1,168 @@
+"""Measures ingest throughput against the number of worker processes on the job queue.
+
+Fills a temporary tasks.db with N message jobs, starts the given numbers of
+worker processes and times how long they take to empty the queue (from the
+moment all of them are initialised). The Gemini request is replaced by a
+stand-in with two parts:
+
+- --latency seconds of waiting, like the network round trip;
+- --cpu-ms of busy CPU work that holds the GIL, standing in for response
+  parsing and the local work around each classification.
+
+Together with the real per-message work (duplicate index sync and embedding,
+task writes, claims), this makes a single process CPU-bound once enough LLM
+calls overlap. For comparison, each multi-process run is followed by a
+control run: one process with the same total LLM concurrency and batch size.
+The control only overlaps waiting, so the gap between the two rows is what
+spreading CPU work over cores adds. That gap needs at least as many cores as
+workers; the script warns when the machine has fewer.
+
+Usage: python scripts/bench_workers.py [--jobs 1000] [--workers 1 2 4] [--latency 0.1] [--cpu-ms 50]
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src import config
+from src.context import database
+from src.context import job_queue
+from src.context.sqlite_store import SQLiteTaskStore
+from src.ingest import rules
+
+_WORDS = ("please", "review", "the", "report", "deploy", "meeting", "tomorrow", "budget", "fix", "login",
+          "bug", "send", "invoice", "lunch", "thanks", "ok", "call", "client", "draft", "slides")
+
+
+async def fill(path: str, count: int, task_share: float):
+    store = SQLiteTaskStore(path, shared=True)
+    await store.init()
+    await store.close()
+    queue = job_queue.JobQueue(path)
+    await queue.init()
+    rng = random.Random(0)
+    for i in range(count):
+        words = rng.choices(_WORDS, k=12)
+        if rng.random() < task_share:
+            words.insert(0, "TODO")
+        await queue.enqueue(job_queue.MESSAGE, {
+            'chat_id': -1000 - i % 20,
+            'chat_type': rules.GROUP,
+            'chat_title': f"group {i % 20}",
+            'message_id': i,
+            'sender': f"user{i % 50}",
+            'text': f"{' '.join(words)} #{i}",
+            'detected_at': "2024-01-01T09:00:00+00:00",
+        })
+    await queue.close()
+
+
+def _burn(cpu_ms: float):
+    # process_time counts only this process's CPU, so the work is the same however busy the cores are
+    end = time.process_time() + cpu_ms / 1000
+    while time.process_time() < end:
+        pass
+
+
+def _run_worker(path: str, index_path: str, latency: float, cpu_ms: float,
+                concurrency: int, batch_size: int, ready: multiprocessing.Barrier):
+    # Set before the worker and budget modules are imported, which read them at import time
+    config.LLM_CONCURRENCY = concurrency
+    config.QUEUE_BATCH_SIZE = batch_size
+    config.LLM_BUDGET_ENABLED = True
+    config.LLM_CHAT_DAILY_TOKENS = 10 ** 9
+    config.DEDUP_INDEX_PATH = index_path
+
+    from src.context import similarity
+    from src.ingest import budget
+    from src.ingest import worker
+    from src.llm import client as llm_client
+
+    async def classify(text: str) -> llm_client.Classification:
+        await asyncio.sleep(latency)
+        _burn(cpu_ms)
+        return llm_client.Classification(text.startswith("TODO"), tokens=200)
+
+    # Benchmark only: stand-in for the Gemini request
+    llm_client.classify = classify
+
+    async def run():
+        database.set_store(SQLiteTaskStore(path, shared=True))
+        await database.init_db()
+        await similarity.init_index(set(), database.iter_pending_tasks)
+        await budget.init()
+        queue = job_queue.JobQueue(path)
+        await queue.init()
+        runner = worker.Worker(queue, f"bench:{os.getpid()}", batch_size=batch_size)
+        await asyncio.to_thread(ready.wait)
+        await runner.run(exit_when_empty=True)
+        await budget.close()
+        await queue.close()
+        await database.close_db()
+
+    asyncio.run(run())
+
+
+def measure(label: str, processes: int, concurrency: int, batch_size: int, args) -> float:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        asyncio.run(fill(path, args.jobs, args.task_share))
+        context = multiprocessing.get_context("spawn")
+        ready = context.Barrier(processes + 1)
+        workers = [
+            context.Process(target=_run_worker, args=(path, os.path.join(tmp, f"index{i}.npz"), args.latency,
+                                                      args.cpu_ms, concurrency, batch_size, ready))
+            for i in range(processes)
+        ]
+        for process in workers:
+            process.start()
+        ready.wait(timeout=300)
+        started = time.perf_counter()
+        for process in workers:
+            process.join()
+        elapsed = time.perf_counter() - started
+
+        async def count():
+            left = await job_queue.JobQueue(path).stats()
+            return sum(left.get(job_queue.MESSAGE, {}).values())
+        left = asyncio.run(count())
+    rate = args.jobs / elapsed
+    print(f"{label:<10} {processes:>9} {concurrency:>11} {elapsed:>8.1f} {rate:>8.1f} {left:>5}")
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--jobs", type=int, default=1000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--latency", type=float, default=0.1, help="simulated seconds waiting on the LLM")
+    parser.add_argument("--cpu-ms", type=float, default=50, help="simulated CPU milliseconds per classification")
+    parser.add_argument("--task-share", type=float, default=0.2)
+    args = parser.parse_args()
+
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+    concurrency, batch_size = config.LLM_CONCURRENCY, config.QUEUE_BATCH_SIZE
+    print(f"cores={cores} llm concurrency/process={concurrency} batch_size={batch_size} "
+          f"latency={args.latency}s cpu={args.cpu_ms}ms")
+    if cores < max(args.workers):
+        print(f"Warning: only {cores} core(s); workers beyond that share CPU and can only overlap LLM waits.")
+    print(f"{'mode':<10} {'processes':>9} {'concurrency':>11} {'secs':>8} {'jobs/s':>8} {'left':>5}")
+
+    baseline = None
+    for workers in args.workers:
+        rate = measure("workers", workers, concurrency, batch_size, args)
+        baseline = baseline or rate
+        if workers > 1:
+            control = measure("control", 1, concurrency * workers, batch_size * workers, args)
+            print(f"{'':<10} speedup x{rate / baseline:.2f} vs 1 worker, x{rate / control:.2f} vs one process "
+                  f"with {workers}x concurrency")
+
+
+if __name__ == "__main__":
+    main()
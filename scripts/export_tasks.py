@@ -0,0 +1,74 @@
+"""Exports tasks from tasks.db as gzip-compressed CSV or JSONL.
+
+Writes to --output, or uploads the file to notifier.target_chat_id through the
+notifier bot when no output path is given. The range uses the same syntax as
+the /completed bot command, e.g. "7d", "2024-05-01..2024-05-07".
+
+Usage: python scripts/export_tasks.py [pending|completed|all] [--range 7d] [--format csv|jsonl] [--output tasks.csv.gz]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram import Bot
+
+from src import config
+from src.bot.date_range import parse_range
+from src.context import database
+from src.context import export
+from src.context.sqlite_store import SQLiteTaskStore
+
+
+async def upload(path: str, filename: str, caption: str):
+    if not config.NOTIFIER_BOT_TOKEN or not config.NOTIFIER_TARGET_CHAT_ID:
+        raise SystemExit("notifier.bot_token and notifier.target_chat_id are needed to upload; use --output instead.")
+    size = os.path.getsize(path)
+    if size > export.MAX_UPLOAD_BYTES:
+        raise SystemExit(f"Export is {size / 1e6:.1f} MB, over the Telegram upload limit; use --output instead.")
+    async with Bot(config.NOTIFIER_BOT_TOKEN) as bot:
+        with open(path, "rb") as f:
+            await bot.send_document(config.NOTIFIER_TARGET_CHAT_ID, f, filename=filename, caption=caption,
+                                    write_timeout=120)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("kind", nargs="?", choices=export.KINDS, default="all")
+    parser.add_argument("--range", default="", help='e.g. "today", "7d", "2024-05-01..2024-05-07"')
+    parser.add_argument("--format", choices=export.FORMATS, default="csv")
+    parser.add_argument("--output", help="file to write; uploads through the notifier bot when omitted")
+    parser.add_argument("--db", default=config.DB_NAME)
+    args = parser.parse_args()
+
+    try:
+        date_range = parse_range(args.range.split(), config.settings().tz())
+    except ValueError as e:
+        raise SystemExit(f"Invalid --range: {e}")
+
+    database.set_store(SQLiteTaskStore(args.db))
+    await database.init_db()
+    try:
+        if args.output:
+            rows = await export.export_tasks(args.output, args.kind, args.format, date_range.from_ts, date_range.to_ts)
+            print(f"Wrote {rows} tasks to {args.output} ({os.path.getsize(args.output) / 1e6:.1f} MB).")
+            return
+
+        fd, path = tempfile.mkstemp(suffix=f".{args.format}.gz")
+        os.close(fd)
+        try:
+            rows = await export.export_tasks(path, args.kind, args.format, date_range.from_ts, date_range.to_ts)
+            caption = f"{args.kind} tasks: {rows}" + (f" ({date_range.label})" if date_range.label else "")
+            await upload(path, export.export_filename(args.kind, args.format), caption)
+            print(f"Uploaded {rows} tasks.")
+        finally:
+            os.remove(path)
+    finally:
+        await database.close_db()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
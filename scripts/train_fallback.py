@@ -0,0 +1,76 @@
+"""Trains the offline fallback classifier from the labelled messages in tasks.db.
+
+Labels come from Gemini's verdicts in classifier_samples, overridden by what
+the user did with a task: done counts as a task, dismissed as not a task.
+Tasks the fallback itself created (tagged fallback or budget) are left out so
+the model never trains on its own predictions, and each message text is used
+once. The model is written to llm.fallback_model.
+
+Usage: python scripts/train_fallback.py [--db tasks.db] [--output fallback_model.json]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src import config
+from src.ingest.budget import BUDGET_TAG
+from src.ingest.recheck import FALLBACK_TAG
+from src.llm.fallback import NaiveBayesClassifier
+
+_UNCONFIRMED_TAGS = {FALLBACK_TAG, BUDGET_TAG}
+
+
+def load_samples(db_path: str) -> list[tuple[str, bool]]:
+    # Keyed by content: a message seen several times, or both sampled and
+    # turned into a task, counts once and the later source wins
+    labels: dict[str, bool] = {}
+    conn = sqlite3.connect(db_path)
+    try:
+        try:
+            for content, is_task in conn.execute("SELECT content, is_task FROM classifier_samples ORDER BY id"):
+                labels[content] = bool(is_task)
+        except sqlite3.OperationalError:
+            print("No classifier_samples table yet, training on settled tasks only.")
+        for content, status, tags in conn.execute(
+                "SELECT content, status, tags FROM tasks WHERE status IN ('done', 'dismissed') ORDER BY id"):
+            if _UNCONFIRMED_TAGS & set((tags or "").split(",")):
+                continue
+            labels[content] = status == "done"
+    finally:
+        conn.close()
+    return list(labels.items())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default=config.DB_NAME)
+    parser.add_argument("--output", default=config.LLM_FALLBACK_MODEL)
+    parser.add_argument("--holdout", type=float, default=0.2, help="fraction of samples used for evaluation")
+    args = parser.parse_args()
+
+    samples = load_samples(args.db)
+    positives = sum(1 for _, is_task in samples if is_task)
+    print(f"Loaded {len(samples)} samples ({positives} tasks, {len(samples) - positives} non-tasks).")
+    if positives == 0 or positives == len(samples):
+        print("Need both tasks and non-tasks to train. Let the bot run with llm.record_samples enabled first.")
+        return
+
+    random.Random(0).shuffle(samples)
+    split = int(len(samples) * (1 - args.holdout))
+    if 0 < split < len(samples):
+        model = NaiveBayesClassifier.train(samples[:split])
+        holdout = samples[split:]
+        correct = sum(model.predict(text) == is_task for text, is_task in holdout)
+        print(f"Holdout accuracy: {correct / len(holdout):.1%} on {len(holdout)} samples.")
+
+    model = NaiveBayesClassifier.train(samples)
+    model.save(args.output)
+    print(f"Saved fallback model to {args.output}.")
+
+
+if __name__ == "__main__":
+    main()
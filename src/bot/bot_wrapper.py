@@ -1,6 +1,6 @@
 import asyncio
 import functools
-from typing import Optional
+from typing import TYPE_CHECKING, Optional
 from telethon import TelegramClient, events
 from telethon.sessions import StringSession
 from telegram.ext import Application, CommandHandler, MessageHandler, filters
@@ -8,16 +8,28 @@ from telegram.ext import Application, CommandHandler, MessageHandler, filters
 from src import config
 from src.ingest.handler import handle_message
 from src.bot import command_handler
+from src.bot import outbound
+from src.ingest import recheck
 from src.scheduler.jobs import run_scheduler
+from src.config_watcher import watch_config
+from src.log import get_logger
+
+if TYPE_CHECKING:
+    from src.bot.main import Supervisor
+
+logger = get_logger("bot")
 
 
 class TelegramBotWrapper:
     """包裝 Telegram 機器人的類別，整合 user_client 和 bot_app"""
     
-    def __init__(self, user_client: TelegramClient):
+    def __init__(self, user_client: TelegramClient, supervisor: 'Supervisor'):
         self.user_client: TelegramClient = user_client
+        self.supervisor = supervisor
         self.bot_app: Optional[Application] = None
         self._running = False
+        self._stopped = asyncio.Event()
+        self._config_watcher: Optional[asyncio.Task] = None
     
     async def initialize(self):
         """初始化 bot_app（user_client 已經透過構造函數注入）"""
@@ -26,7 +38,7 @@ class TelegramBotWrapper:
             self.bot_app = Application.builder().token(config.NOTIFIER_BOT_TOKEN).build()
             self._register_handlers()
         else:
-            print("⚠️ Notifier bot token not set, command handling will be disabled.")
+            logger.warning("Notifier bot token not set, command handling will be disabled.")
             return False
         
         return True
@@ -46,6 +58,10 @@ class TelegramBotWrapper:
         self.bot_app.add_handler(CommandHandler("help", handler.help_command))
         self.bot_app.add_handler(CommandHandler("userinfo", handler.user_info_command))  # 新增指令
         self.bot_app.add_handler(CommandHandler("send", handler.send_message_command))  # 新增指令
+        self.bot_app.add_handler(CommandHandler("reload", handler.reload_command))
+        self.bot_app.add_handler(CommandHandler("outbox", handler.outbox_command))
+        self.bot_app.add_handler(CommandHandler("llmstats", handler.llmstats_command))
+        self.bot_app.add_handler(CommandHandler("export", handler.export_command))
         # Add a handler for unknown commands
         self.bot_app.add_handler(MessageHandler(filters.COMMAND, handler.unknown_command))
     
@@ -54,43 +70,61 @@ class TelegramBotWrapper:
         if not self.user_client or not self.bot_app:
             raise ValueError("請先呼叫 initialize() 方法或確認 user_client 已注入")
         
+        # Outbound queues must exist before the first message is handled
+        outbound.create_dispatchers()
+
+        # Re-classify messages handled by the fallback classifier once Gemini is back.
+        # With the job queue, a worker started with --recheck does this instead
+        if not config.QUEUE_ENABLED:
+            recheck.install()
+
         # Register Event Handlers for User Client
         user_handler = functools.partial(
             handle_message, 
             client=self.user_client, 
             bot=self.bot_app.bot
         )
-        self.user_client.on(events.NewMessage())(user_handler)
+        # Tracked so shutdown can wait for messages that are mid-LLM call or DB write
+        self.user_client.on(events.NewMessage())(self.supervisor.track_ingest(user_handler))
         
         # Start bot application
         if self.bot_app and self.bot_app.updater:
-            print("🚀 Notifier Bot is running...")
+            logger.info("Notifier Bot is running...")
             # Initialize and start the bot application
             await self.bot_app.initialize()
             await self.bot_app.start()
             await self.bot_app.updater.start_polling()
             
             # Start scheduler with both clients
-            scheduler_coro = run_scheduler(self.user_client, self.bot_app.bot)
-            if scheduler_coro:
-                asyncio.create_task(scheduler_coro)
+            self.supervisor.spawn(run_scheduler(self.user_client, self.bot_app.bot), "scheduler")
+
+        # Reload config.yaml on change without reconnecting the clients
+        if config.CONFIG_WATCH:
+            self._config_watcher = self.supervisor.spawn(watch_config(), "config-watcher")
         
         self._running = True
+        self._stopped.clear()
     
     async def run_until_disconnected(self):
         """運行直到斷線（user_client 由外部管理）"""
         if not self.user_client:
             return
             
-        # user_client 的運行由外部控制，這裡只需要等待
-        # 如果需要等待，可以使用一個簡單的等待邏輯
-        while self._running:
-            await asyncio.sleep(1)
+        # user_client 的運行由外部控制，這裡只需要等待 stop() 被呼叫
+        await self._stopped.wait()
     
-    async def stop(self):
+    async def stop(self, drain_timeout: float = 5.0):
         """停止 bot application（user_client 由外部管理）"""
         self._running = False
+        self._stopped.set()
+
+        if self._config_watcher:
+            self._config_watcher.cancel()
+            self._config_watcher = None
         
+        # Flush queued replies while both clients are still connected
+        await outbound.stop_dispatchers(drain_timeout)
+
         # Stop bot application
         if self.bot_app and self.bot_app.updater:
             await self.bot_app.updater.stop()
@@ -116,7 +150,7 @@ class TelegramBotWrapper:
                 'is_bot': getattr(entity, 'bot', False)
             }
         except Exception as e:
-            print(f"Error getting user info: {e}")
+            logger.error("Error getting user info: %s", e)
             return None
     
     async def send_message_as_user(self, chat_id: int, message: str):
@@ -128,7 +162,7 @@ class TelegramBotWrapper:
             await self.user_client.send_message(chat_id, message)
             return True
         except Exception as e:
-            print(f"Error sending message as user: {e}")
+            logger.error("Error sending message as user: %s", e)
             return False
     
     async def get_chat_info(self, chat_id: int):
@@ -145,7 +179,7 @@ class TelegramBotWrapper:
                 'type': type(entity).__name__
             }
         except Exception as e:
-            print(f"Error getting chat info: {e}")
+            logger.error("Error getting chat info: %s", e)
             return None
     
     @property
@@ -1,14 +1,26 @@
 import datetime
+import os
+import tempfile
 from telegram import Update
 from telegram.ext import ContextTypes
+from telegram.helpers import escape_markdown
 from typing import TYPE_CHECKING
 
 from src.context import database
+from src.context import export
+from src.context import job_queue
 from src import config
+from src import config_watcher
+from src.bot import outbound
+from src.ingest import budget
+from src.bot.date_range import USAGE as DATE_RANGE_USAGE, parse_range
+from src.log import get_logger
 
 if TYPE_CHECKING:
     from src.bot.bot_wrapper import TelegramBotWrapper
 
+logger = get_logger("commands")
+
 
 class CommandHandler:
     """處理 Telegram Bot 指令的類別"""
@@ -19,7 +31,7 @@ class CommandHandler:
     async def _is_authorized(self, chat_id: int, context: ContextTypes.DEFAULT_TYPE) -> bool:
         """Checks if the command is from an authorized chat."""
         if chat_id != config.NOTIFIER_TARGET_CHAT_ID:
-            print(f"🚫 Ignored command from unauthorized chat ID: {chat_id}")
+            logger.warning("Ignored command from unauthorized chat.", extra={"chat_id": chat_id})
             await context.bot.send_message(
                 chat_id=chat_id,
                 text="Sorry, you are not authorized to use this bot."
@@ -40,12 +52,12 @@ class CommandHandler:
             task_id = int(context.args[0])
             await database.update_task_status(task_id, "done")
             await update.message.reply_text(f"✅ 任務 {task_id} 已標記為完成！")
-            print(f"Task {task_id} marked as done via bot command.")
+            logger.info("Task %s marked as done via bot command.", task_id, extra={"task_id": task_id})
         except (ValueError, IndexError):
             await update.message.reply_text("請提供有效的任務編號，例如：`/done 123`")
         except Exception as e:
             await update.message.reply_text(f"更新任務時發生錯誤：{e}")
-            print(f"🚨 ERROR processing /done command: {e}")
+            logger.error("Error processing /done command: %s", e)
 
     async def tasks_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Lists all pending tasks."""
@@ -53,81 +65,68 @@ class CommandHandler:
         if not await self._is_authorized(update.effective_chat.id, context):
             return
             
-        print("Processing /tasks command...")
+        logger.debug("Processing /tasks command...")
         try:
-            pending_tasks = await database.get_pending_tasks()
-            if not pending_tasks:
+            lines = []
+            async for task in database.iter_pending_summaries(preview_len=50):
+                chat_info = f"來自: {task.sender}"
+                status_icon = "🔴" if task.status == 'new' else "🟡"
+                lines.append(f"{len(lines) + 1}. (ID: {task.id}) {status_icon} [{chat_info}] {task.preview}...\n")
+            if not lines:
                 await update.message.reply_text("🎉 目前沒有未處理事項！")
                 return
             
-            message = "📜 **目前未處理事項**：\n\n"
-            for i, task in enumerate(pending_tasks, 1):
-                chat_info = f"來自: {task['sender']}"
-                status_icon = "🔴" if task['status'] == 'new' else "🟡"
-                message += f"{i}. (ID: {task['id']}) {status_icon} [{chat_info}] {task['content'][:50]}...\n"
-            
+            message = "📜 **目前未處理事項**：\n\n" + "".join(lines)
             message += "\n使用 `/done <任務編號>` 來標記完成。"
             await update.message.reply_text(message, parse_mode='Markdown')
-            print(f"Sent pending tasks list with {len(pending_tasks)} tasks.")
+            logger.info("Sent pending tasks list with %d tasks.", len(lines))
 
         except Exception as e:
             await update.message.reply_text(f"取得任務列表時發生錯誤：{e}")
-            print(f"🚨 ERROR processing /tasks command: {e}")
+            logger.error("Error processing /tasks command: %s", e)
 
     async def completed_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-        """Lists completed tasks. Usage: /completed [today|yesterday]"""
+        """Lists completed tasks. Usage: /completed [today|yesterday|7d|last N days|<date>|<date> <date>]"""
         if not update.message or not update.effective_chat: return
         if not await self._is_authorized(update.effective_chat.id, context):
             return
 
-        print("Processing /completed command...")
-        from_date = None
-        to_date = None
-
-        if context.args:
-            time_frame = context.args[0].lower()
-            today = datetime.date.today()
-            if time_frame == "today":
-                from_date = today.isoformat()
-                to_date = today.isoformat() + "T23:59:59.999999"
-            elif time_frame == "yesterday":
-                yesterday = today - datetime.timedelta(days=1)
-                from_date = yesterday.isoformat()
-                to_date = yesterday.isoformat() + "T23:59:59.999999"
-            else:
-                await update.message.reply_text("無效的參數。請使用 `/completed today` 或 `/completed yesterday` 或不帶參數。")
-                return
+        logger.debug("Processing /completed command...")
+        tz = config.settings().tz()
+        try:
+            date_range = parse_range(context.args or [], tz)
+        except ValueError as e:
+            # The error quotes the user's input, which may contain Markdown characters
+            await update.message.reply_text(f"{escape_markdown(str(e))}。用法：{DATE_RANGE_USAGE}", parse_mode='Markdown')
+            return
 
         try:
-            completed_tasks = await database.get_completed_tasks(from_date=from_date, to_date=to_date)
-            if not completed_tasks:
-                if from_date and to_date:
-                    await update.message.reply_text(f"🎉 在 {from_date.split('T')[0]} 沒有已完成事項！")
+            lines = []
+            async for task in database.iter_completed_summaries(from_ts=date_range.from_ts, to_ts=date_range.to_ts,
+                                                                preview_len=50):
+                chat_info = f"對話 ID: {task.chat_id}"
+                completed_on = datetime.datetime.fromtimestamp(task.completed_ts, tz).date().isoformat() if task.completed_ts else "?"
+                lines.append(f"{len(lines) + 1}. (ID: {task.id}) [{chat_info}] {escape_markdown(task.preview)}... "
+                             f"(於 {completed_on} 完成)\n")
+            if not lines:
+                if date_range.label:
+                    await update.message.reply_text(f"🎉 在 {date_range.label} 沒有已完成事項！")
                 else:
                     await update.message.reply_text("🎉 目前沒有已完成事項！")
                 return
-            
+
             message_title = "✅ **已完成事項**"
-            if from_date and to_date:
-                if from_date.split('T')[0] == datetime.date.today().isoformat():
-                    message_title += " (今天)"
-                elif from_date.split('T')[0] == (datetime.date.today() - datetime.timedelta(days=1)).isoformat():
-                    message_title += " (昨天)"
-                else:
-                    message_title += f" ({from_date.split('T')[0]} 至 {to_date.split('T')[0]})"
+            if date_range.label:
+                message_title += f" ({escape_markdown(date_range.label)})"
 
-            message = f"{message_title}：\n\n"
+            message = f"{message_title}：\n\n" + "".join(lines)
 
-            for i, task in enumerate(completed_tasks, 1):
-                chat_info = f"對話 ID: {task['chat_id']}"
-                message += f"{i}. (ID: {task['id']}) [{chat_info}] {task['content'][:50]}... (於 {task['completed_at'].split('T')[0]} 完成)\n"
-            
-            await update.message.reply_text(message, parse_mode='MarkdownV2')
-            print(f"Sent completed tasks list with {len(completed_tasks)} tasks.")
+            await update.message.reply_text(message, parse_mode='Markdown')
+            logger.info("Sent completed tasks list with %d tasks.", len(lines))
 
         except Exception as e:
             await update.message.reply_text(f"取得已完成任務列表時發生錯誤：{e}")
-            print(f"🚨 ERROR processing /completed command: {e}")
+            logger.error("Error processing /completed command: %s", e)
 
     async def user_info_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """取得使用者資訊（示範 bot 呼叫 user_client 功能）. Usage: /userinfo <user_id>"""
@@ -141,7 +140,7 @@ class CommandHandler:
                 return
             
             user_id = int(context.args[0])
-            print(f"Processing /userinfo command for user ID: {user_id}")
+            logger.debug("Processing /userinfo command for user ID: %s", user_id)
             
             # 使用 bot_wrapper 來呼叫 user_client 功能
             user_info = await self.bot_wrapper.get_user_info(user_id)
@@ -163,13 +162,13 @@ class CommandHandler:
             message += f"是否為機器人: {'是' if user_info['is_bot'] else '否'}\n"
             
             await update.message.reply_text(message, parse_mode='Markdown')
-            print(f"Sent user info for user ID: {user_id}")
+            logger.info("Sent user info for user ID: %s", user_id)
 
         except ValueError:
             await update.message.reply_text("請提供有效的使用者 ID 數字")
         except Exception as e:
             await update.message.reply_text(f"取得使用者資訊時發生錯誤：{e}")
-            print(f"🚨 ERROR processing /userinfo command: {e}")
+            logger.error("Error processing /userinfo command: %s", e)
 
     async def send_message_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """透過 user_client 發送訊息. Usage: /send <chat_id> <message>"""
@@ -185,14 +184,14 @@ class CommandHandler:
             chat_id = int(context.args[0])
             message_text = " ".join(context.args[1:])
             
-            print(f"Processing /send command to chat ID: {chat_id}")
+            logger.debug("Processing /send command.", extra={"chat_id": chat_id})
             
             # 使用 bot_wrapper 來透過 user_client 發送訊息
             success = await self.bot_wrapper.send_message_as_user(chat_id, message_text)
             
             if success:
                 await update.message.reply_text(f"✅ 訊息已透過 User Client 發送到聊天室 {chat_id}")
-                print(f"Message sent to chat {chat_id} via user client")
+                logger.info("Message sent via user client.", extra={"chat_id": chat_id})
             else:
                 await update.message.reply_text(f"❌ 無法發送訊息到聊天室 {chat_id}")
 
@@ -200,7 +199,118 @@ class CommandHandler:
             await update.message.reply_text("請提供有效的聊天室 ID 數字")
         except Exception as e:
             await update.message.reply_text(f"發送訊息時發生錯誤：{e}")
-            print(f"🚨 ERROR processing /send command: {e}")
+            logger.error("Error processing /send command: %s", e)
+
+    async def reload_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Reloads config.yaml without restarting the clients. Usage: /reload"""
+        if not update.message or not update.effective_chat: return
+        if not await self._is_authorized(update.effective_chat.id, context):
+            return
+
+        success, summary = config_watcher.reload_config()
+        if success:
+            await update.message.reply_text(f"🔄 {summary}")
+        else:
+            await update.message.reply_text(f"❌ 設定檔有誤，維持目前設定：{summary}")
+
+    async def outbox_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Shows outbound queue depth and send latency. Usage: /outbox"""
+        if not update.message or not update.effective_chat: return
+        if not await self._is_authorized(update.effective_chat.id, context):
+            return
+
+        lines = ["📤 發送佇列狀態："]
+        for name in (outbound.USER, outbound.BOT):
+            dispatcher = outbound.get_dispatcher(name)
+            if not dispatcher:
+                continue
+            stats = dispatcher.stats()
+            lines.append(
+                f"\n[{name}] 佇列: {stats['queue_depth']} 則 / {stats['chats_waiting']} 個對話\n"
+                f"已送出: {stats['sent']}，合併: {stats['coalesced']}，FloodWait: {stats['flood_waits']}，失敗: {stats['failed']}\n"
+                f"發送延遲 p50/p95: {stats['send_ms']['p50']}/{stats['send_ms']['p95']} ms\n"
+                f"排隊延遲 p50/p95: {stats['queued_ms']['p50']}/{stats['queued_ms']['p95']} ms"
+            )
+        if config.QUEUE_ENABLED:
+            jobs = await job_queue.get_queue().stats()
+            lines.append("\n[工作佇列]")
+            for kind in (job_queue.MESSAGE, job_queue.REPLY):
+                counts = jobs.get(kind, {})
+                lines.append(f"{kind}: 等待 {counts.get(job_queue.QUEUED, 0)}，處理中 {counts.get(job_queue.RUNNING, 0)}，"
+                             f"失敗 {counts.get(job_queue.FAILED, 0)}")
+        await update.message.reply_text("\n".join(lines))
+
+    async def export_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Sends tasks as a gzip-compressed file. Usage: /export [pending|completed|all] [日期範圍] [csv|jsonl]"""
+        if not update.message or not update.effective_chat: return
+        if not await self._is_authorized(update.effective_chat.id, context):
+            return
+
+        args = list(context.args or [])
+        kind = args.pop(0).lower() if args and args[0].lower() in export.KINDS else "all"
+        fmt = args.pop().lower() if args and args[-1].lower() in export.FORMATS else "csv"
+        try:
+            date_range = parse_range(args, config.settings().tz())
+        except ValueError as e:
+            await update.message.reply_text(
+                f"{escape_markdown(str(e))}。用法：`/export [pending|completed|all] [日期範圍] [csv|jsonl]`，"
+                f"日期範圍同 /completed：{DATE_RANGE_USAGE}",
+                parse_mode='Markdown')
+            return
+
+        filename = export.export_filename(kind, fmt)
+        fd, path = tempfile.mkstemp(suffix=f".{fmt}.gz")
+        os.close(fd)
+        try:
+            await update.message.reply_text("⏳ 匯出中…")
+            rows = await export.export_tasks(path, kind, fmt, date_range.from_ts, date_range.to_ts)
+            size = os.path.getsize(path)
+            if size > export.MAX_UPLOAD_BYTES:
+                await update.message.reply_text(
+                    f"匯出檔案 {size / 1e6:.1f} MB 超過 Telegram 上傳上限，請縮小日期範圍或使用 scripts/export_tasks.py。")
+                return
+            caption = f"📦 {kind} 任務 {rows} 筆" + (f" ({date_range.label})" if date_range.label else "")
+            with open(path, "rb") as f:
+                await update.message.reply_document(f, filename=filename, caption=caption, write_timeout=120)
+            logger.info("Sent export with %d rows.", rows, extra={"bytes": size})
+        except Exception as e:
+            await update.message.reply_text(f"匯出任務時發生錯誤：{e}")
+            logger.error("Error processing /export command: %s", e)
+        finally:
+            os.remove(path)
+
+    async def llmstats_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Shows per-chat LLM usage, task yield and budget. Usage: /llmstats [數量]"""
+        if not update.message or not update.effective_chat: return
+        if not await self._is_authorized(update.effective_chat.id, context):
+            return
+
+        try:
+            limit = int(context.args[0]) if context.args else 15
+        except ValueError:
+            await update.message.reply_text("請提供有效的數量，例如：`/llmstats 20`", parse_mode='Markdown')
+            return
+
+        stats = budget.get_manager().stats()
+        global_cap = stats['global_cap'] or "∞"
+        lines = [
+            "🧮 LLM 使用統計：",
+            f"今日群組/頻道 tokens: {stats['global_today']} / {global_cap}",
+            f"進行中請求: {stats['active']}，排隊中: {stats['waiting']}",
+        ]
+        if not stats['chats']:
+            lines.append("\n尚無統計資料。")
+        for chat in stats['chats'][:limit]:
+            cap = chat['daily_cap'] if chat['daily_cap'] is not None else "∞"
+            lines.append(
+                f"\n#{chat['rank']} {chat['title'] or chat['chat_id']} [{chat['chat_type']}]\n"
+                f"分類: {chat['classified']}，任務: {chat['tasks']} (產出率 {chat['yield']:.0%})\n"
+                f"完成: {chat['done']}，擱置: {chat['ignored']}，已駁回: {chat['dismissed']} (完成率 {chat['done_rate']:.0%})\n"
+                f"今日 tokens: {chat['tokens_today']} / {cap}，累計: {chat['tokens_total']}，超額改用本地分類: {chat['skipped']}"
+            )
+        if len(stats['chats']) > limit:
+            lines.append(f"\n…另有 {len(stats['chats']) - limit} 個對話")
+        await update.message.reply_text("\n".join(lines))
 
     async def help_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Displays the help message."""
@@ -216,14 +326,21 @@ class CommandHandler:
             "`/completed` - 顯示所有已完成的任務。\n"
             "`/completed today` - 顯示今天完成的任務。\n"
             "`/completed yesterday` - 顯示昨天完成的任務。\n"
-            "`/done <任務編號>` - 標記指定編號的任務為完成。\n\n"
+            "`/completed 7d` 或 `/completed last 7 days` - 顯示最近 7 天完成的任務。\n"
+            "`/completed 2024-05-01 2024-05-07` - 顯示指定日期範圍內完成的任務（也可用 `2024-05-01..2024-05-07`）。\n"
+            "`/done <任務編號>` - 標記指定編號的任務為完成。\n"
+            "`/export [pending|completed|all] [日期範圍] [csv|jsonl]` - 匯出任務為 gzip 壓縮檔。\n\n"
             "🔧 **User Client 功能**：\n"
             "`/userinfo <使用者ID>` - 取得使用者資訊（透過 User Client）。\n"
             "`/send <聊天室ID> <訊息>` - 透過 User Client 發送訊息。\n\n"
+            "⚙️ **設定**：\n"
+            "`/reload` - 重新載入 config.yaml（不需重新啟動）。\n"
+            "`/outbox` - 顯示發送佇列狀態與延遲。\n"
+            "`/llmstats [數量]` - 顯示各對話的 LLM 用量、任務產出率與每日額度。\n\n"
             "我還會自動記錄您在群組中標記我 ( @您的使用者名稱 ) 或私訊我的任務喔！"
         )
         await update.message.reply_text(help_message, parse_mode='Markdown')
-        print("Sent help message.")
+        logger.debug("Sent help message.")
 
     async def unknown_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Handles unknown commands."""
@@ -236,20 +353,20 @@ class CommandHandler:
 # 為了向後兼容，保留原始函數（如果有其他地方在使用）
 async def done_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Deprecated: 請使用 CommandHandler 類別"""
-    print("⚠️ Warning: Using deprecated done_command function")
+    logger.warning("Using deprecated done_command function")
 
 async def tasks_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Deprecated: 請使用 CommandHandler 類別"""
-    print("⚠️ Warning: Using deprecated tasks_command function")
+    logger.warning("Using deprecated tasks_command function")
 
 async def completed_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Deprecated: 請使用 CommandHandler 類別"""
-    print("⚠️ Warning: Using deprecated completed_command function")
+    logger.warning("Using deprecated completed_command function")
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Deprecated: 請使用 CommandHandler 類別"""
-    print("⚠️ Warning: Using deprecated help_command function")
+    logger.warning("Using deprecated help_command function")
 
 async def unknown_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Deprecated: 請使用 CommandHandler 類別"""
-    print("⚠️ Warning: Using deprecated unknown_command function") 
\ No newline at end of file
+    logger.warning("Using deprecated unknown_command function") 
\ No newline at end of file
@@ -0,0 +1,93 @@
+"""Parses the date range arguments of /completed into epoch bounds.
+
+Day boundaries are computed in the configured time zone, so "today" means
+the user's calendar day regardless of where the bot is hosted. Ranges are
+half-open [from_ts, to_ts) to match the store's completed_ts queries.
+"""
+import re
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta, tzinfo
+from typing import Optional
+
+USAGE = (
+    "`/completed` 全部、`/completed today`、`/completed yesterday`、"
+    "`/completed 7d`、`/completed last 7 days`、`/completed 2024-05-01`、"
+    "`/completed 2024-05-01 2024-05-07`、`/completed 2024-05-01..2024-05-07`、"
+    "`/completed from 2024-05-01 to 2024-05-07`"
+)
+
+_DAYS = re.compile(r"^(\d+)d$")
+_RANGE = re.compile(r"^(\d{4}-\d{2}-\d{2})\.\.(\d{4}-\d{2}-\d{2})$")
+_OUT_OF_RANGE = "日期超出可查詢的範圍"
+
+
+@dataclass(frozen=True)
+class DateRange:
+    from_ts: Optional[int]
+    to_ts: Optional[int]
+    label: str
+
+
+def _parse_date(value: str) -> date:
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"無法辨識的日期：{value}")
+
+
+def _day_start(day: date, tz: tzinfo) -> int:
+    # Midnight is resolved per day, so ranges spanning a DST change stay exact
+    return int(datetime.combine(day, time.min, tzinfo=tz).timestamp())
+
+
+def _days(first: date, last: date, tz: tzinfo, label: str) -> DateRange:
+    if last < first:
+        raise ValueError("結束日期不能早於開始日期")
+    try:
+        return DateRange(_day_start(first, tz), _day_start(last + timedelta(days=1), tz), label)
+    except (OverflowError, ValueError):
+        # e.g. 9999-12-31, whose next day is past date.max
+        raise ValueError(_OUT_OF_RANGE)
+
+
+def parse_range(args: list[str], tz: tzinfo, now: Optional[datetime] = None) -> DateRange:
+    """Turns command arguments into a DateRange. Raises ValueError with a user-facing message."""
+    today = (now or datetime.now(tz)).astimezone(tz).date()
+    words = [arg.lower() for arg in args]
+
+    if not words:
+        return DateRange(None, None, "")
+    if words == ["today"]:
+        return _days(today, today, tz, "今天")
+    if words == ["yesterday"]:
+        yesterday = today - timedelta(days=1)
+        return _days(yesterday, yesterday, tz, "昨天")
+
+    # 7d, last 7, last 7 days: the last N calendar days including today
+    count = None
+    if len(words) == 1 and (match := _DAYS.match(words[0])):
+        count = int(match.group(1))
+    elif words[0] == "last" and len(words) in (2, 3) and words[1].isdigit() and words[2:] in ([], ["days"], ["day"]):
+        count = int(words[1])
+    if count is not None:
+        if count < 1:
+            raise ValueError("天數必須至少為 1")
+        try:
+            first = today - timedelta(days=count - 1)
+        except OverflowError:
+            raise ValueError(_OUT_OF_RANGE)
+        return _days(first, today, tz, f"最近 {count} 天")
+
+    # Inclusive calendar dates
+    if len(words) == 4 and words[0] == "from" and words[2] == "to":
+        words = [words[1], words[3]]
+    elif len(words) == 1 and (match := _RANGE.match(words[0])):
+        words = [match.group(1), match.group(2)]
+    if len(words) == 1:
+        day = _parse_date(words[0])
+        return _days(day, day, tz, day.isoformat())
+    if len(words) == 2:
+        first, last = _parse_date(words[0]), _parse_date(words[1])
+        return _days(first, last, tz, f"{first.isoformat()} 至 {last.isoformat()}")
+
+    raise ValueError("無法辨識的日期範圍")
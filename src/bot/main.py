@@ -1,11 +1,185 @@
 import asyncio
+import contextlib
+import functools
+import signal
+import time
+from typing import Awaitable, Callable, Coroutine, Optional
 from telethon import TelegramClient
 from telethon.sessions import StringSession
 
 from src import config
+from src import log
 from src.context import database
+from src.context import job_queue
+from src.context import similarity
+from src.ingest import budget
+from src.ingest import recheck
+from src.ingest.worker import relay_replies
+from src.scheduler.jobs import stop_scheduler
 from src.bot.bot_wrapper import TelegramBotWrapper
 
+logger = log.get_logger("bot")
+
+
+class Supervisor:
+    """Owns the process lifecycle: background tasks, in-flight messages and shutdown.
+
+    Nothing polls: the main coroutine waits on `shutdown_requested`, which is
+    set by SIGTERM/SIGINT or when the user client disconnects. Shutdown then
+    stops taking new messages, lets in-flight ones finish within a deadline,
+    and records how long each phase took.
+    """
+
+    def __init__(self, timeout: float = config.SHUTDOWN_TIMEOUT):
+        self.timeout = timeout
+        self.shutdown_requested = asyncio.Event()
+        self.reason: Optional[str] = None
+        self.timings: dict[str, float] = {}
+        self._background: set[asyncio.Task] = set()
+        self._ingest: set[asyncio.Task] = set()
+        self._accepting = True
+        self._deadline: Optional[float] = None
+
+    # --- Tracking ---
+
+    def spawn(self, coro: Coroutine, name: str) -> asyncio.Task:
+        """Starts a background task that is logged if it fails and cancelled on shutdown."""
+        task = asyncio.create_task(coro, name=name)
+        self._background.add(task)
+        task.add_done_callback(self._background_done)
+        return task
+
+    def _background_done(self, task: asyncio.Task):
+        self._background.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Background task %s failed: %r", task.get_name(), task.exception())
+
+    def track_ingest(self, handler: Callable[..., Awaitable]) -> Callable[..., Awaitable]:
+        """Wraps a message handler so shutdown can wait for the calls in progress."""
+        @functools.wraps(handler)
+        async def tracked(event):
+            if not self._accepting:
+                logger.warning("Shutting down, message not processed.", extra={"chat_id": event.chat_id})
+                return
+            task = asyncio.current_task()
+            self._ingest.add(task)
+            try:
+                await handler(event)
+            finally:
+                self._ingest.discard(task)
+        return tracked
+
+    # --- Shutdown ---
+
+    def install_signal_handlers(self):
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            try:
+                loop.add_signal_handler(sig, self.request_shutdown, sig.name)
+            except NotImplementedError:
+                # Windows: Ctrl+C still raises KeyboardInterrupt and the finally blocks run
+                pass
+
+    def request_shutdown(self, reason: str):
+        if self.shutdown_requested.is_set():
+            return
+        self.reason = reason
+        logger.info("Shutdown requested (%s).", reason)
+        self.shutdown_requested.set()
+
+    async def wait(self, user_client: TelegramClient):
+        """Returns once shutdown is requested or the user client disconnects."""
+        requested = asyncio.ensure_future(self.shutdown_requested.wait())
+        disconnected = asyncio.ensure_future(user_client.disconnected)
+        await asyncio.wait((requested, disconnected), return_when=asyncio.FIRST_COMPLETED)
+        for future in (requested, disconnected):
+            future.cancel()
+        self.request_shutdown("user client disconnected")
+
+    def remaining(self) -> float:
+        """Seconds left until the shutdown deadline."""
+        if self._deadline is None:
+            return self.timeout
+        return max(0.0, self._deadline - time.monotonic())
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        started = time.monotonic()
+        try:
+            yield
+        except Exception as e:
+            # One failing step must not skip the flushes after it
+            logger.exception("Shutdown phase %s failed: %s", name, e)
+        finally:
+            self.timings[name] = round((time.monotonic() - started) * 1000, 1)
+
+    async def drain_ingest(self, timeout: float, keep_accepting: bool = False) -> tuple[int, int]:
+        """Stops accepting messages and waits for in-flight ones. Returns (finished, cancelled).
+
+        With `keep_accepting`, messages that arrive meanwhile are still handled;
+        a later call without it stops them.
+        """
+        self._accepting = keep_accepting
+        pending = set(self._ingest)
+        if not pending:
+            return 0, 0
+        logger.info("Waiting for %d in-flight messages.", len(pending))
+        done, pending = await asyncio.wait(pending, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.wait(pending, timeout=1)
+        return len(done), len(pending)
+
+    async def cancel_background(self, timeout: float):
+        tasks = set(self._background)
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.wait(tasks, timeout=timeout)
+
+    async def shutdown(self, user_client: TelegramClient, bot_wrapper: TelegramBotWrapper):
+        """Stops everything in dependency order within the shutdown deadline."""
+        started = time.monotonic()
+        self._deadline = started + self.timeout
+        finished = cancelled = 0
+
+        # 0. A summary firing from here on would go through a stopping bot
+        with self.phase("scheduler"):
+            stop_scheduler()
+        # 1. Let messages mid-LLM call or DB write finish; their replies are queued.
+        # With the job queue, messages are only enqueued, so keep taking them until it closes
+        with self.phase("ingest"):
+            finished, cancelled = await self.drain_ingest(min(config.SHUTDOWN_INGEST_DRAIN, self.remaining()),
+                                                          keep_accepting=config.QUEUE_ENABLED)
+        # 2. Send queued replies while both clients are still connected
+        with self.phase("bot"):
+            await bot_wrapper.stop(drain_timeout=self.remaining())
+        # 3. Background work is either resumable (rechecks) or periodic
+        with self.phase("background"):
+            await recheck.stop()
+            await self.cancel_background(timeout=max(self.remaining(), 0.5))
+        # 4. Always runs, even past the deadline: these are quick and lose data if skipped
+        with self.phase("flush"):
+            if config.QUEUE_ENABLED:
+                late_finished, late_cancelled = await self.drain_ingest(1.0)
+                finished, cancelled = finished + late_finished, cancelled + late_cancelled
+            await budget.close()
+            similarity.save_index()
+            await job_queue.close_queue()
+            await database.close_db()
+        with self.phase("disconnect"):
+            if user_client.is_connected():
+                await user_client.disconnect()  # type: ignore
+
+        total = time.monotonic() - started
+        log_method = logger.warning if cancelled or total > self.timeout else logger.info
+        log_method("Shutdown finished in %.2fs (%s).", total, self.reason, extra={
+            "phases_ms": self.timings,
+            "ingest_finished": finished,
+            "ingest_cancelled": cancelled,
+        })
+
 
 def create_user_client() -> TelegramClient:
     """創建並配置 Telethon User Client"""
@@ -19,39 +193,58 @@ def create_user_client() -> TelegramClient:
 
 async def main():
     """Main entry point to run the user client and the bot client concurrently."""
-    
+    log.setup_logging()
+    try:
+        await _run()
+    finally:
+        log.shutdown_logging()
+
+
+async def _run():
+    supervisor = Supervisor()
+    supervisor.install_signal_handlers()
+
     # 1. Initialize Database
-    database.init_db()
+    await database.init_db()
+    pending_ids = {task.id async for task in database.iter_pending_summaries(preview_len=0)}
+    await similarity.init_index(pending_ids, database.iter_pending_tasks)
+    await budget.init()
+    if config.QUEUE_ENABLED:
+        await job_queue.init_queue()
 
     # 2. Create User Client
     user_client = create_user_client()
-    
+
     # 3. Create bot wrapper with injected user_client
-    bot_wrapper = TelegramBotWrapper(user_client)
-    
+    bot_wrapper = TelegramBotWrapper(user_client, supervisor)
+
     if not await bot_wrapper.initialize():
-        print("❌ Bot initialization failed")
+        logger.error("Bot initialization failed")
+        await budget.close()
+        await job_queue.close_queue()
+        await database.close_db()
         return
-    
+
     # 4. Start user client first
     try:
         await user_client.start()  # type: ignore
-        print("🚀 Copilot User is running...")
-        
+        logger.info("Copilot User is running...")
+
         # 5. Start the bot wrapper
         await bot_wrapper.start()
-        
-        # 6. Run user client until disconnected
-        await user_client.run_until_disconnected()  # type: ignore
-        
+        if config.QUEUE_ENABLED:
+            # Workers classify; this process sends the confirmations they ask for
+            supervisor.spawn(relay_replies(user_client, supervisor.shutdown_requested), "reply-relay")
+
+        # 6. Run until a signal arrives or the user client disconnects
+        await supervisor.wait(user_client)
+
     except Exception as e:
-        print(f"🚨 An error occurred: {e}")
+        logger.exception("An error occurred: %s", e)
+        supervisor.request_shutdown("error")
     finally:
-        # Ensure clients are disconnected on exit
-        await bot_wrapper.stop()
-        if user_client.is_connected():
-            await user_client.disconnect()  # type: ignore
+        await supervisor.shutdown(user_client, bot_wrapper)
 
 
 if __name__ == "__main__":
-    asyncio.run(main()) 
\ No newline at end of file
+    asyncio.run(main())
@@ -0,0 +1,346 @@
+import asyncio
+import collections
+import datetime
+import re
+import statistics
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Optional
+
+from telegram.error import RetryAfter
+from telethon.errors import FloodWaitError
+
+from src import config
+from src.log import get_logger
+
+logger = get_logger("outbound")
+
+# Dispatcher names: messages sent as the user account vs. by the notifier bot.
+# They have separate Telegram rate limits, so each gets its own global bucket.
+USER = "user"
+BOT = "bot"
+
+# The task id list render() appends to a confirmation, e.g. "\n(12, 13)"
+_TASK_IDS_SUFFIX = re.compile(r"\n\(\d+(?:, \d+)*\)$")
+
+SendFunc = Callable[[str], Awaitable]
+# Told the outcome once a message is sent (None) or given up on (the error)
+DoneFunc = Callable[[Optional[Exception]], None]
+
+
+class TokenBucket:
+    """Allows `rate` sends per second with bursts of up to `burst`."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self) -> float:
+        """Seconds until a send is allowed; 0 if it is allowed now."""
+        now = time.monotonic()
+        self._refill(now)
+        wait = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+        return max(wait, self.paused_until - now)
+
+    def consume(self):
+        self.tokens -= 1
+
+    def pause(self, seconds: float):
+        """Blocks the bucket, e.g. for the duration of a FloodWait."""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+@dataclass
+class _Outgoing:
+    send: SendFunc
+    text: str
+    # Confirmations carry task ids so several can be merged into one message
+    task_ids: list[int] = field(default_factory=list)
+    enqueued_at: float = field(default_factory=time.monotonic)
+    attempts: int = 0
+    on_done: list[DoneFunc] = field(default_factory=list)
+
+    def render(self) -> str:
+        if not self.task_ids:
+            return self.text
+        return f"{self.text}\n({', '.join(str(task_id) for task_id in self.task_ids)})"
+
+
+def strip_task_ids(text: str) -> str:
+    """Returns a sent confirmation without the task ids render() appended."""
+    return _TASK_IDS_SUFFIX.sub("", text)
+
+
+def _flood_wait_seconds(error: Exception) -> Optional[float]:
+    if isinstance(error, FloodWaitError):
+        return float(error.seconds)
+    if isinstance(error, RetryAfter):
+        retry_after = error.retry_after
+        if isinstance(retry_after, datetime.timedelta):
+            return retry_after.total_seconds()
+        return float(retry_after)
+    return None
+
+
+class OutboundDispatcher:
+    """Rate-limited outbound send queue.
+
+    Each chat has its own FIFO and token bucket, and all chats share a global
+    bucket. Chats are served round-robin so one busy group can't starve the
+    rest. FloodWait errors pause the chat and the global bucket, and the
+    message is retried.
+    """
+
+    def __init__(self, name: str, global_rate: float, global_burst: float,
+                 chat_rate: float, chat_burst: float, coalesce: bool = True, max_retries: int = 3):
+        self.name = name
+        self.coalesce = coalesce
+        self.max_retries = max_retries
+        self._chat_rate = chat_rate
+        self._chat_burst = chat_burst
+        self._global = TokenBucket(global_rate, global_burst)
+        self._chat_buckets: dict[int, TokenBucket] = {}
+        self._queues: dict[int, collections.deque[_Outgoing]] = {}
+        self._scheduled: set[int] = set()
+        self._ready: asyncio.Queue[int] = asyncio.Queue()
+        self._worker: Optional[asyncio.Task] = None
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._send_latencies: collections.deque[float] = collections.deque(maxlen=500)
+        self._queue_latencies: collections.deque[float] = collections.deque(maxlen=500)
+        self._counters = collections.Counter()
+
+    # --- Producer API ---
+
+    def submit(self, chat_id: int, text: str, send: SendFunc):
+        """Queues a message. `send` is called with the final text."""
+        self._enqueue(chat_id, _Outgoing(send=send, text=text))
+
+    def submit_confirmation(self, chat_id: int, text: str, task_id: int, send: SendFunc,
+                            on_done: Optional[DoneFunc] = None):
+        """Queues a task confirmation, which may be merged with others for the same chat.
+
+        `on_done` is called when the message carrying this confirmation is sent
+        or given up on; not at all if it is dropped on shutdown.
+        """
+        self._enqueue(chat_id, _Outgoing(send=send, text=text, task_ids=[task_id],
+                                         on_done=[on_done] if on_done else []))
+
+    def _enqueue(self, chat_id: int, item: _Outgoing):
+        self._queues.setdefault(chat_id, collections.deque()).append(item)
+        self._counters["submitted"] += 1
+        self._idle.clear()
+        self._schedule(chat_id)
+
+    def _schedule(self, chat_id: int, delay: float = 0.0):
+        if delay > 0:
+            asyncio.get_running_loop().call_later(delay, self._ready.put_nowait, chat_id)
+            return
+        if chat_id not in self._scheduled:
+            self._scheduled.add(chat_id)
+            self._ready.put_nowait(chat_id)
+
+    # --- Worker ---
+
+    def start(self):
+        if self._worker is None:
+            self._worker = asyncio.create_task(self._run(), name=f"outbound-{self.name}")
+
+    async def stop(self, drain_timeout: float = 5.0):
+        """Waits up to `drain_timeout` seconds for queued messages, then stops the worker."""
+        if self._worker is None:
+            return
+        try:
+            await asyncio.wait_for(self._idle.wait(), drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Dropping %d unsent messages on shutdown.", self.queue_depth, extra={"dispatcher": self.name})
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self._chat_rate, self._chat_burst)
+        return bucket
+
+    def _next_item(self, queue: collections.deque[_Outgoing]) -> _Outgoing:
+        item = queue.popleft()
+        if not (self.coalesce and item.task_ids):
+            return item
+        merged = 0
+        while queue and queue[0].task_ids and queue[0].text == item.text:
+            follower = queue.popleft()
+            # Reply to the newest message, but keep the oldest enqueue time for latency
+            item = _Outgoing(send=follower.send, text=item.text, task_ids=item.task_ids + follower.task_ids,
+                             enqueued_at=item.enqueued_at, on_done=item.on_done + follower.on_done)
+            merged += 1
+        self._counters["coalesced"] += merged
+        return item
+
+    async def _run(self):
+        while True:
+            chat_id = await self._ready.get()
+            queue = self._queues.get(chat_id)
+            if not queue:
+                self._finish_chat(chat_id)
+                continue
+
+            bucket = self._chat_bucket(chat_id)
+            wait = max(bucket.delay(), self._global.delay())
+            if wait > 0:
+                # Come back to this chat later; other chats keep flowing meanwhile
+                self._schedule(chat_id, wait)
+                continue
+
+            item = self._next_item(queue)
+            bucket.consume()
+            self._global.consume()
+            await self._send(chat_id, bucket, queue, item)
+
+            if queue:
+                self._ready.put_nowait(chat_id)
+            else:
+                self._finish_chat(chat_id)
+
+    def _finish_chat(self, chat_id: int):
+        self._scheduled.discard(chat_id)
+        self._queues.pop(chat_id, None)
+        if not self._queues:
+            self._idle.set()
+
+    async def _send(self, chat_id: int, bucket: TokenBucket, queue: collections.deque[_Outgoing], item: _Outgoing):
+        started = time.monotonic()
+        try:
+            await item.send(item.render())
+        except Exception as e:
+            seconds = _flood_wait_seconds(e)
+            if seconds is None:
+                self._counters["failed"] += 1
+                logger.error("Failed to send message: %s", e, extra={"dispatcher": self.name, "chat_id": chat_id})
+                self._notify(item, e)
+                return
+            self._counters["flood_waits"] += 1
+            bucket.pause(seconds)
+            # FloodWaits are mostly account-wide, so other chats hold off too
+            self._global.pause(seconds)
+            item.attempts += 1
+            if item.attempts > self.max_retries:
+                self._counters["failed"] += 1
+                logger.error("Giving up after %d FloodWaits.", item.attempts, extra={"dispatcher": self.name, "chat_id": chat_id})
+                self._notify(item, e)
+                return
+            queue.appendleft(item)
+            logger.warning("FloodWait, retrying in %.0fs.", seconds, extra={"dispatcher": self.name, "chat_id": chat_id})
+            return
+
+        finished = time.monotonic()
+        self._send_latencies.append(finished - started)
+        self._queue_latencies.append(started - item.enqueued_at)
+        self._counters["sent"] += 1
+        logger.debug("Message sent.", extra={
+            "dispatcher": self.name,
+            "chat_id": chat_id,
+            "send_ms": round((finished - started) * 1000, 1),
+            "queued_ms": round((started - item.enqueued_at) * 1000, 1),
+            "queue_depth": self.queue_depth,
+        })
+        self._notify(item, None)
+
+    def _notify(self, item: _Outgoing, error: Optional[Exception]):
+        for on_done in item.on_done:
+            try:
+                on_done(error)
+            except Exception as e:
+                logger.error("Send callback failed: %s", e, extra={"dispatcher": self.name})
+
+    # --- Metrics ---
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    def stats(self) -> dict:
+        """Counters, current queue depth and send/queue latency percentiles in ms."""
+        def percentiles(samples) -> dict:
+            if len(samples) < 2:
+                value = round(samples[0] * 1000, 1) if samples else None
+                return {"p50": value, "p95": value}
+            cuts = statistics.quantiles(samples, n=20)
+            return {"p50": round(cuts[9] * 1000, 1), "p95": round(cuts[18] * 1000, 1)}
+
+        return {
+            "queue_depth": self.queue_depth,
+            "chats_waiting": len(self._queues),
+            **{key: self._counters[key] for key in ("submitted", "sent", "coalesced", "flood_waits", "failed")},
+            "send_ms": percentiles(self._send_latencies),
+            "queued_ms": percentiles(self._queue_latencies),
+        }
+
+
+_dispatchers: dict[str, OutboundDispatcher] = {}
+
+
+def create_dispatchers() -> dict[str, OutboundDispatcher]:
+    """Creates and starts the user and bot dispatchers from config."""
+    for name, global_rate in ((USER, config.OUTBOUND_USER_GLOBAL_RATE), (BOT, config.OUTBOUND_BOT_GLOBAL_RATE)):
+        if name in _dispatchers:
+            continue
+        dispatcher = OutboundDispatcher(
+            name,
+            global_rate=global_rate,
+            global_burst=global_rate,
+            chat_rate=config.OUTBOUND_CHAT_RATE,
+            chat_burst=config.OUTBOUND_CHAT_BURST,
+            coalesce=config.OUTBOUND_COALESCE,
+            max_retries=config.OUTBOUND_MAX_RETRIES,
+        )
+        dispatcher.start()
+        _dispatchers[name] = dispatcher
+    return _dispatchers
+
+
+def get_dispatcher(name: str) -> Optional[OutboundDispatcher]:
+    return _dispatchers.get(name)
+
+
+async def send(name: str, chat_id: int, text: str, send_func: SendFunc):
+    """Queues a message on the named dispatcher, or sends it directly if there is none."""
+    dispatcher = _dispatchers.get(name)
+    if dispatcher is None:
+        await send_func(text)
+    else:
+        dispatcher.submit(chat_id, text, send_func)
+
+
+async def send_confirmation(name: str, chat_id: int, text: str, task_id: int, send_func: SendFunc,
+                            on_done: Optional[DoneFunc] = None):
+    """Like send(), but lets the dispatcher merge confirmations for the same chat."""
+    dispatcher = _dispatchers.get(name)
+    if dispatcher is None:
+        try:
+            await send_func(f"{text}\n({task_id})")
+        except Exception as e:
+            if on_done:
+                on_done(e)
+            raise
+        if on_done:
+            on_done(None)
+    else:
+        dispatcher.submit_confirmation(chat_id, text, task_id, send_func, on_done)
+
+
+async def stop_dispatchers(drain_timeout: float = 5.0):
+    for dispatcher in list(_dispatchers.values()):
+        await dispatcher.stop(drain_timeout)
+    _dispatchers.clear()
@@ -1,20 +1,41 @@
+import logging
 import yaml
 import os
+from dataclasses import dataclass
+from datetime import datetime, tzinfo
+from typing import Callable
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 from dotenv import load_dotenv
 
+from src.ingest import rules
+
 # Load environment variables from .env file first
 load_dotenv()
 
+CONFIG_PATH = "config.yaml"
+
+# Same logger as src.log.get_logger("config"); src.log imports this module, so not imported here
+logger = logging.getLogger("telehelper.config")
+
+class ConfigError(ValueError):
+    """Raised when config.yaml contains invalid values."""
+
+def _read_config(path: str) -> dict:
+    with open(path, "r", encoding="utf-8") as f:
+        raw = yaml.safe_load(f)
+    if raw is None:
+        return {}
+    if not isinstance(raw, dict):
+        raise ConfigError(f"{path} must contain a mapping at the top level")
+    return raw
+
 # Load config from YAML file
 try:
-    with open("config.yaml", "r", encoding="utf-8") as f:
-        config = yaml.safe_load(f)
-        if config is None:
-            config = {}
+    config = _read_config(CONFIG_PATH)
 except FileNotFoundError:
     print("❌ config.yaml not found. Please copy config.yaml.example to config.yaml and fill in your details.")
     config = {} # Create an empty config dict to avoid crashes below
-except yaml.YAMLError as e:
+except (yaml.YAMLError, ConfigError) as e:
     print(f"❌ Error parsing config.yaml: {e}")
     config = {}
 
@@ -27,18 +48,6 @@ APP_HASH = telegram_config.get("app_hash", "")
 gemini_config = config.get("gemini_api", {})
 GEMINI_API_KEY = gemini_config.get("api_key", "")
 
-# --- Bot Settings ---
-bot_settings_config = config.get("bot_settings", {})
-IGNORE_GROUPS = bot_settings_config.get("ignore_groups", [])
-TELEGRAM_USER_NAME = bot_settings_config.get("telegram_user_name", "Boss")
-ENABLE_REPLY = bot_settings_config.get("enable_reply", True)
-ENABLE_REPLY_IN_PRIVATE = bot_settings_config.get("enable_reply_in_private", True)
-TASK_ADDED_REPLY = bot_settings_config.get("task_added_reply", "Note it.")
-
-# --- Scheduler Settings ---
-scheduler_config = config.get("scheduler", {})
-DAILY_SUMMARY_CRON = scheduler_config.get("daily_summary_cron", "0 9 * * *")
-
 # --- Notifier Bot Settings ---
 notifier_config = config.get("notifier", {})
 NOTIFIER_BOT_TOKEN = notifier_config.get("bot_token", "")
@@ -47,6 +56,224 @@ NOTIFIER_TARGET_CHAT_ID = notifier_config.get("target_chat_id", 0)
 # --- Database ---
 database_config = config.get("database", {})
 DB_NAME = database_config.get("name", "tasks.db")
+# "sqlite" (default) or "memory" for tests and benchmarks (nothing is persisted)
+DB_BACKEND = database_config.get("backend", "sqlite")
+
+# --- Duplicate Task Detection ---
+dedup_config = config.get("dedup", {})
+DEDUP_ENABLED = dedup_config.get("enabled", True)
+DEDUP_EMBEDDER = dedup_config.get("embedder", "hashing")
+DEDUP_DIM = int(dedup_config.get("dim", 512))
+DEDUP_NGRAM = int(dedup_config.get("ngram", 3))
+DEDUP_INDEX_PATH = dedup_config.get("index_path", f"{DB_NAME}.index.npz")
+
+# --- Logging ---
+logging_config = config.get("logging", {})
+LOG_LEVEL = logging_config.get("level", "INFO")
+LOG_FORMAT = logging_config.get("format", "text")  # "text" or "json"
+LOG_QUEUE_SIZE = int(logging_config.get("queue_size", 10000))
+# Per-category overrides: {category: {level, rate_limit (records/s), sample (0-1)}}
+LOG_CATEGORIES = logging_config.get("categories", {}) or {}
+
+# --- LLM Circuit Breaker & Fallback ---
+llm_config = config.get("llm", {})
+LLM_TIMEOUT = float(llm_config.get("timeout", 10))
+breaker_config = llm_config.get("circuit_breaker", {}) or {}
+LLM_BREAKER_FAILURES = int(breaker_config.get("failure_threshold", 3))
+LLM_BREAKER_LATENCY = float(breaker_config.get("latency_threshold", 5))
+LLM_BREAKER_RESET = float(breaker_config.get("reset_timeout", 30))
+LLM_FALLBACK_MODEL = llm_config.get("fallback_model", "fallback_model.json")
+LLM_RECORD_SAMPLES = llm_config.get("record_samples", True)
+LLM_SAMPLE_LIMIT = int(llm_config.get("sample_limit", 20000))
+
+# --- LLM Budget ---
+budget_config = llm_config.get("budget", {}) or {}
+LLM_BUDGET_ENABLED = budget_config.get("enabled", True)
+LLM_CONCURRENCY = max(1, int(budget_config.get("concurrency", 2)))
+LLM_CHAT_DAILY_TOKENS = int(budget_config.get("chat_daily_tokens", 20000))
+LLM_DAILY_TOKENS = int(budget_config.get("daily_tokens", 0))  # 0 = no global cap
+LLM_BUDGET_MIN_FACTOR = float(budget_config.get("min_factor", 0.1))
+LLM_BUDGET_MAX_FACTOR = float(budget_config.get("max_factor", 5))
+LLM_PRIOR_YIELD = float(budget_config.get("prior_yield", 0.2))
+LLM_PRIOR_WEIGHT = float(budget_config.get("prior_weight", 20))
+LLM_IGNORE_AFTER_DAYS = float(budget_config.get("ignore_after_days", 3))
+LLM_STATS_FLUSH_INTERVAL = float(budget_config.get("flush_interval", 60))
+
+# --- Outbound Messages ---
+outbound_config = config.get("outbound", {})
+# Telegram allows roughly 30 messages/s globally and about 1/s per chat (20/min in groups)
+OUTBOUND_USER_GLOBAL_RATE = max(0.1, float(outbound_config.get("user_global_rate", 20)))
+OUTBOUND_BOT_GLOBAL_RATE = max(0.1, float(outbound_config.get("bot_global_rate", 25)))
+OUTBOUND_CHAT_RATE = max(0.01, float(outbound_config.get("chat_rate", 0.33)))
+OUTBOUND_CHAT_BURST = max(1.0, float(outbound_config.get("chat_burst", 3)))
+OUTBOUND_COALESCE = outbound_config.get("coalesce_confirmations", True)
+OUTBOUND_MAX_RETRIES = int(outbound_config.get("max_retries", 3))
+
+# --- Config Reload ---
+config_reload_config = config.get("config_reload", {})
+CONFIG_WATCH = config_reload_config.get("watch", True)
+CONFIG_WATCH_INTERVAL = float(config_reload_config.get("interval", 5))
+
+# --- Shutdown ---
+shutdown_config = config.get("shutdown", {}) or {}
+# Docker sends SIGKILL 10s after SIGTERM by default, so finish well before that
+SHUTDOWN_TIMEOUT = float(shutdown_config.get("timeout", 8))
+SHUTDOWN_INGEST_DRAIN = float(shutdown_config.get("ingest_drain_timeout", 5))
+
+# --- Ingest Job Queue ---
+queue_config = config.get("queue", {}) or {}
+# When enabled, the Telegram process only enqueues messages and `python worker.py` processes them
+QUEUE_ENABLED = queue_config.get("enabled", False)
+QUEUE_LEASE = max(5.0, float(queue_config.get("lease", 30)))
+QUEUE_HEARTBEAT = max(1.0, min(float(queue_config.get("heartbeat", 10)), QUEUE_LEASE / 2))
+QUEUE_MAX_ATTEMPTS = max(1, int(queue_config.get("max_attempts", 5)))
+QUEUE_BATCH_SIZE = max(1, int(queue_config.get("batch_size", 8)))
+QUEUE_POLL_INTERVAL = max(0.05, float(queue_config.get("poll_interval", 0.5)))
+QUEUE_RECHECK_INTERVAL = max(5.0, float(queue_config.get("recheck_interval", 60)))
+
+# --- Reloadable Settings ---
+# Everything the ingest filters and the scheduler read at runtime lives in an
+# immutable snapshot. reload() builds and validates a new one, then swaps it in
+# with a single assignment so readers never see a half-updated config.
+
+@dataclass(frozen=True)
+class Settings:
+    filters: rules.RuleSet = rules.compile_rules({}, [])
+    telegram_user_name: str = "Boss"
+    enable_reply: bool = True
+    enable_reply_in_private: bool = True
+    task_added_reply: str = "Note it."
+    daily_summary_cron: str = "0 9 * * *"
+    dedup_threshold: float = 0.85
+    timezone: str = ""  # IANA name; empty means the host's local zone
+
+    def tz(self) -> tzinfo:
+        """Returns the zone used for day boundaries and displayed dates."""
+        if self.timezone:
+            return ZoneInfo(self.timezone)
+        return datetime.now().astimezone().tzinfo
+
+def _section(raw: dict, name: str) -> dict:
+    value = raw.get(name) or {}
+    if not isinstance(value, dict):
+        raise ConfigError(f"'{name}' must be a mapping")
+    return value
+
+def _typed(section: dict, key: str, default, expected: type, name: str):
+    value = section.get(key, default)
+    if not isinstance(value, expected) or (expected is not bool and isinstance(value, bool)):
+        type_name = getattr(expected, "__name__", "number")
+        raise ConfigError(f"'{name}.{key}' must be of type {type_name}, got {value!r}")
+    return value
+
+def build_settings(raw: dict) -> Settings:
+    """Validates the reloadable part of a config dict and compiles it into a Settings snapshot."""
+    bot_settings = _section(raw, "bot_settings")
+    scheduler = _section(raw, "scheduler")
+    dedup = _section(raw, "dedup")
+    filters = _section(raw, "filters")
+
+    ignore_groups = bot_settings.get("ignore_groups") or []
+    if not isinstance(ignore_groups, list) or not all(isinstance(g, (int, str)) for g in ignore_groups):
+        raise ConfigError("'bot_settings.ignore_groups' must be a list of group IDs, titles or usernames")
+    try:
+        ruleset = rules.compile_rules(filters, ignore_groups)
+    except ValueError as e:
+        raise ConfigError(f"Invalid 'filters' section: {e}") from e
+
+    cron = str(_typed(scheduler, "daily_summary_cron", "0 9 * * *", str, "scheduler"))
+    if len(cron.split()) not in (5, 6):
+        raise ConfigError(f"'scheduler.daily_summary_cron' is not a valid cron expression: {cron!r}")
+
+    threshold = float(_typed(dedup, "threshold", 0.85, (int, float), "dedup"))
+    if not 0 < threshold <= 1:
+        raise ConfigError("'dedup.threshold' must be between 0 and 1")
+
+    timezone = _typed(bot_settings, "timezone", "", str, "bot_settings")
+    if timezone:
+        try:
+            ZoneInfo(timezone)
+        except (ZoneInfoNotFoundError, ValueError):
+            raise ConfigError(f"'bot_settings.timezone' is not a known IANA time zone: {timezone!r}")
+
+    return Settings(
+        filters=ruleset,
+        telegram_user_name=str(bot_settings.get("telegram_user_name", "Boss")),
+        enable_reply=_typed(bot_settings, "enable_reply", True, bool, "bot_settings"),
+        enable_reply_in_private=_typed(bot_settings, "enable_reply_in_private", True, bool, "bot_settings"),
+        task_added_reply=str(bot_settings.get("task_added_reply", "Note it.")),
+        daily_summary_cron=cron,
+        dedup_threshold=threshold,
+        timezone=timezone,
+    )
+
+try:
+    _settings = build_settings(config)
+except ConfigError as e:
+    print(f"❌ Invalid settings in config.yaml, using defaults: {e}")
+    _settings = Settings()
+_validators: list[Callable[[Settings], None]] = []
+_listeners: list[Callable[[Settings, Settings], None]] = []
+
+# Sections that are only read at startup; changing them needs a restart
+RESTART_ONLY_SECTIONS = ("telegram_api", "gemini_api", "notifier", "database", "logging", "config_reload",
+                         "outbound", "llm", "shutdown", "queue")
+RESTART_ONLY_DEDUP_KEYS = ("enabled", "embedder", "dim", "ngram", "index_path")
+
+def settings() -> Settings:
+    """Returns the current settings snapshot. Read it once per unit of work."""
+    return _settings
+
+def add_validator(validator: Callable[[Settings], None]):
+    """Registers an extra check run on a new snapshot before it is swapped in.
+
+    Validators raise an exception to reject the snapshot.
+    """
+    _validators.append(validator)
+
+def on_reload(listener: Callable[[Settings, Settings], None]):
+    """Registers a callback invoked with (old, new) after a successful reload.
+
+    Listeners run after the swap. One that raises is logged and does not
+    stop the others or undo the reload.
+    """
+    _listeners.append(listener)
+
+def reload(path: str = CONFIG_PATH) -> tuple[Settings, list[str]]:
+    """Re-reads config.yaml and atomically swaps in the new settings.
+
+    Returns the new snapshot and the restart-only sections that changed (those
+    keep their old values). Raises ConfigError and keeps the current snapshot
+    if the file can't be parsed or fails validation.
+    """
+    global _settings, config
+    try:
+        raw = _read_config(path)
+    except (OSError, yaml.YAMLError) as e:
+        raise ConfigError(f"Could not read {path}: {e}") from e
+
+    new = build_settings(raw)
+    for validator in _validators:
+        try:
+            validator(new)
+        except ConfigError:
+            raise
+        except Exception as e:
+            raise ConfigError(str(e)) from e
+
+    restart_required = [name for name in RESTART_ONLY_SECTIONS if raw.get(name) != config.get(name)]
+    old_dedup, new_dedup = config.get("dedup") or {}, raw.get("dedup") or {}
+    if any(old_dedup.get(key) != new_dedup.get(key) for key in RESTART_ONLY_DEDUP_KEYS):
+        restart_required.append("dedup")
+
+    old, _settings = _settings, new
+    config = raw
+    for listener in _listeners:
+        try:
+            listener(old, new)
+        except Exception as e:
+            logger.exception("Config reload listener %s failed: %s", getattr(listener, "__qualname__", listener), e)
+    return new, restart_required
 
 # --- Perform some checks for critical settings ---
 if not APP_ID or not APP_HASH or APP_HASH == "your_app_hash":
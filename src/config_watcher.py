@@ -0,0 +1,50 @@
+import asyncio
+import os
+from typing import Optional
+
+from src import config
+from src.log import get_logger
+
+logger = get_logger("config")
+
+
+def _signature(path: str) -> Optional[tuple[int, int]]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def reload_config() -> tuple[bool, str]:
+    """Reloads config.yaml and returns (success, human-readable summary)."""
+    try:
+        new, restart_required = config.reload()
+    except config.ConfigError as e:
+        logger.error("Config reload rejected, keeping current settings: %s", e)
+        return False, str(e)
+
+    summary = "Config reloaded."
+    if restart_required:
+        summary += f" Changes to {', '.join(restart_required)} need a restart to take effect."
+        logger.warning(summary)
+    else:
+        logger.info(summary, extra={"daily_summary_cron": new.daily_summary_cron})
+    return True, summary
+
+
+async def watch_config(path: str = config.CONFIG_PATH, interval: float = config.CONFIG_WATCH_INTERVAL):
+    """Polls config.yaml and reloads it whenever it changes.
+
+    Polling the mtime works with bind-mounted files in Docker, where inotify
+    events from the host are not delivered.
+    """
+    last = _signature(path)
+    logger.info("Watching %s for changes every %ss.", path, interval)
+    while True:
+        await asyncio.sleep(interval)
+        current = _signature(path)
+        if current == last or current is None:
+            continue
+        last = current
+        reload_config()
@@ -1,101 +1,134 @@
-import sqlite3
 import datetime
 from src import config
-from typing import Optional
-
-def get_db_connection():
-    conn = sqlite3.connect(config.DB_NAME)
-    conn.row_factory = sqlite3.Row
-    return conn
-
-def init_db():
-    """Initializes the database and creates the tasks table if it doesn't exist."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS tasks (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            source TEXT NOT NULL,
-            chat_id INTEGER NOT NULL,
-            message_id INTEGER NOT NULL,
-            sender TEXT,
-            content TEXT NOT NULL,
-            detected_at TEXT NOT NULL,
-            completed_at TEXT,
-            status TEXT NOT NULL,
-            tags TEXT
-        )
-    """)
-    conn.commit()
-    conn.close()
-    print("Database initialized.")
+from src.context import similarity
+from src.context.models import Task, TaskSummary
+from src.context.store import CLOSED_STATUSES, DEFAULT_CHUNK_SIZE, TaskStore
+from src.log import get_logger
+from typing import AsyncIterator, Callable, Optional
+
+logger = get_logger("database")
+
+_store: Optional[TaskStore] = None
+_status_listeners: list[Callable[[dict, str], None]] = []
+
+def create_store(backend: str) -> TaskStore:
+    """Creates a storage backend by name ("sqlite" or "memory")."""
+    if backend == "sqlite":
+        from src.context.sqlite_store import SQLiteTaskStore
+        return SQLiteTaskStore(config.DB_NAME, shared=config.QUEUE_ENABLED)
+    if backend == "memory":
+        from src.context.memory_store import InMemoryTaskStore
+        return InMemoryTaskStore()
+    raise ValueError(f"Unknown database backend: {backend}")
+
+def get_store() -> TaskStore:
+    """Returns the active store, creating the configured one on first use."""
+    global _store
+    if _store is None:
+        _store = create_store(config.DB_BACKEND)
+    return _store
+
+def set_store(store: TaskStore):
+    """Replaces the active store, e.g. with an in-memory one for benchmarks."""
+    global _store
+    _store = store
+
+async def init_db():
+    """Initializes the configured storage backend."""
+    store = get_store()
+    await store.init()
+    logger.info("Database initialized (%s).", type(store).__name__)
+
+async def close_db():
+    if _store is not None:
+        await _store.close()
 
 async def add_task(task_data: dict):
     """Adds a new task to the database and returns the inserted task's id."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("""
-        INSERT INTO tasks (source, chat_id, message_id, sender, content, detected_at, completed_at, status, tags)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """, (
-        task_data.get('source', 'telegram'),
-        task_data.get('chat_id'),
-        task_data.get('message_id'),
-        task_data.get('sender'),
-        task_data.get('content'),
-        task_data.get('detected_at', datetime.datetime.now().isoformat()),
-        task_data.get('completed_at', None),
-        task_data.get('status', 'new'),
-        ",".join(task_data.get('tags', []))
-    ))
-    task_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
-    print(f"Task added from chat {task_data.get('chat_id')}, id={task_id}")
+    task_id = await get_store().add_task(task_data)
+    logger.info("Task added.", extra={"chat_id": task_data.get('chat_id'), "task_id": task_id})
     return task_id
 
+async def link_message_to_task(task_id: int, message_data: dict, similarity_score: float):
+    """Records a message as a duplicate of an existing task."""
+    await get_store().link_message_to_task(task_id, message_data, similarity_score)
+    logger.info("Message linked to existing task.", extra={"chat_id": message_data.get('chat_id'), "task_id": task_id, "similarity": round(similarity_score, 2)})
+
 async def get_pending_tasks():
-    """Retrieves all tasks that are not marked as 'done'."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM tasks WHERE status != 'done'")
-    tasks = cursor.fetchall()
-    conn.close()
-    return [dict(task) for task in tasks]
+    """Retrieves all tasks that are not marked as 'done' or 'dismissed'."""
+    return await get_store().get_pending_tasks()
+
+def on_status_change(listener: Callable[[dict, str], None]):
+    """Registers a callback invoked with (task before the update, new status) when a task's status changes."""
+    _status_listeners.append(listener)
 
 async def update_task_status(task_id: int, status: str):
     """Updates the status of a specific task."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("UPDATE tasks SET status = ?, completed_at = ? WHERE id = ?", (status, datetime.datetime.now().isoformat(), task_id))
-    conn.commit()
-    conn.close()
-    print(f"Task {task_id} status updated to {status}")
-
-async def get_completed_tasks(from_date: Optional[str] = None, to_date: Optional[str] = None):
-    """Retrieves all tasks that are marked as 'done', optionally filtered by date range."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    query = "SELECT * FROM tasks WHERE status = 'done'"
-    params = []
-
-    if from_date:
-        query += " AND completed_at >= ?"
-        params.append(from_date)
-    if to_date:
-        query += " AND completed_at <= ?"
-        params.append(to_date)
-    
-    cursor.execute(query, params)
-    tasks = cursor.fetchall()
-    conn.close()
-    return [dict(task) for task in tasks]
+    # The old row is only needed by listeners, so skip the lookup without them
+    task = await get_store().get_task_by_id(task_id) if _status_listeners else None
+    await get_store().update_task_status(task_id, status, datetime.datetime.now().astimezone())
+    index = similarity.get_index()
+    if index is not None and status in CLOSED_STATUSES:
+        index.remove(task_id)
+    logger.info("Task status updated to %s.", status, extra={"task_id": task_id})
+    if task is not None and task['status'] != status:
+        for listener in _status_listeners:
+            listener(task, status)
+
+async def get_completed_tasks(from_ts: Optional[int] = None, to_ts: Optional[int] = None):
+    """Retrieves all tasks that are marked as 'done', optionally completed within [from_ts, to_ts)."""
+    return await get_store().get_completed_tasks(from_ts, to_ts)
+
+def iter_tasks(from_ts: Optional[int] = None, to_ts: Optional[int] = None,
+               chunk_size: int = DEFAULT_CHUNK_SIZE) -> AsyncIterator[Task]:
+    """Streams all tasks, optionally detected within [from_ts, to_ts)."""
+    return get_store().iter_tasks(from_ts, to_ts, chunk_size)
+
+def iter_pending_tasks(chunk_size: int = DEFAULT_CHUNK_SIZE, after_id: int = 0) -> AsyncIterator[Task]:
+    """Streams pending tasks without loading the whole result set."""
+    return get_store().iter_pending_tasks(chunk_size, after_id)
+
+def iter_pending_summaries(preview_len: int = 50, chunk_size: int = DEFAULT_CHUNK_SIZE) -> AsyncIterator[TaskSummary]:
+    """Streams pending tasks with only the fields needed to list them."""
+    return get_store().iter_pending_summaries(preview_len, chunk_size)
+
+def iter_completed_tasks(from_ts: Optional[int] = None, to_ts: Optional[int] = None,
+                         chunk_size: int = DEFAULT_CHUNK_SIZE) -> AsyncIterator[Task]:
+    """Streams done tasks, optionally completed within [from_ts, to_ts)."""
+    return get_store().iter_completed_tasks(from_ts, to_ts, chunk_size)
+
+def iter_completed_summaries(from_ts: Optional[int] = None, to_ts: Optional[int] = None,
+                             preview_len: int = 50, chunk_size: int = DEFAULT_CHUNK_SIZE) -> AsyncIterator[TaskSummary]:
+    """Streams done tasks with only the fields needed to list them."""
+    return get_store().iter_completed_summaries(from_ts, to_ts, preview_len, chunk_size)
 
 async def get_task_by_id(task_id: int):
     """Retrieves a single task by its id."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM tasks WHERE id = ?", (task_id,))
-    task = cursor.fetchone()
-    conn.close()
-    return dict(task) if task else None 
\ No newline at end of file
+    return await get_store().get_task_by_id(task_id)
+
+async def add_classifier_sample(content: str, is_task: bool):
+    """Keeps an LLM-labelled message as training data for the fallback classifier."""
+    if config.LLM_RECORD_SAMPLES:
+        await get_store().add_classifier_sample(content, is_task, config.LLM_SAMPLE_LIMIT)
+
+async def add_recheck(recheck_data: dict):
+    """Flags a message classified by the fallback for re-classification by the LLM."""
+    recheck_id = await get_store().add_recheck(recheck_data)
+    logger.info("Message flagged for LLM recheck.", extra={"chat_id": recheck_data.get('chat_id'), "recheck_id": recheck_id})
+    return recheck_id
+
+async def get_rechecks(limit: int = 100):
+    return await get_store().get_rechecks(limit)
+
+async def delete_recheck(recheck_id: int):
+    await get_store().delete_recheck(recheck_id)
+
+async def count_stale_tasks(before_ts: int):
+    """Counts tasks still pending that were detected before before_ts, per chat."""
+    return await get_store().count_stale_tasks(before_ts)
+
+async def get_chat_stats():
+    return await get_store().get_chat_stats()
+
+async def save_chat_stats(rows: list[dict]):
+    await get_store().save_chat_stats(rows)
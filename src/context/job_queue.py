@@ -0,0 +1,215 @@
+"""Durable job queue in tasks.db, shared by the Telegram process and ingest workers.
+
+The Telegram process enqueues raw messages; any number of worker processes
+claim them. A claim is a lease: the job stays invisible to other workers until
+the lease expires, and the owner extends it with heartbeats while it works. A
+worker that dies simply stops renewing, so its jobs are claimed again after the
+lease; delivery is therefore at least once. Jobs that keep failing are marked
+failed after `max_attempts` and kept for inspection.
+"""
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from src import config
+from src.log import get_logger
+
+logger = get_logger("queue")
+
+# Job kinds: incoming messages for the workers, confirmation replies for the Telegram process
+MESSAGE = "message"
+REPLY = "reply"
+
+QUEUED = "queued"
+RUNNING = "running"
+FAILED = "failed"
+
+
+@dataclass(slots=True)
+class Job:
+    id: int
+    kind: str
+    payload: dict
+    attempts: int
+
+
+class JobQueue:
+    """Jobs stored in SQLite. Each process opens its own connection to the file.
+
+    While a job is running, `available_at` holds its lease expiry, so one
+    index serves both new jobs and abandoned ones.
+    """
+
+    def __init__(self, path: str, max_attempts: int = 5):
+        self.path = path
+        self.max_attempts = max_attempts
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            # Autocommit; claims open their own write transaction
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+        return self._conn
+
+    async def _run(self, func, *args):
+        def call():
+            with self._lock:
+                return func(self._connect(), *args)
+        return await asyncio.to_thread(call)
+
+    async def init(self) -> None:
+        await self._run(self._init)
+
+    @staticmethod
+    def _init(conn: sqlite3.Connection):
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'queued',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                available_at REAL NOT NULL,
+                lease_owner TEXT,
+                created_at REAL NOT NULL,
+                last_error TEXT
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_claim ON jobs (kind, available_at) WHERE status != 'failed'")
+
+    async def close(self) -> None:
+        def close():
+            with self._lock:
+                if self._conn is not None:
+                    self._conn.close()
+                    self._conn = None
+        await asyncio.to_thread(close)
+
+    async def enqueue(self, kind: str, payload: dict, delay: float = 0) -> int:
+        """Adds a job and returns its id."""
+        def insert(conn: sqlite3.Connection) -> int:
+            now = time.time()
+            cursor = conn.execute(
+                "INSERT INTO jobs (kind, payload, available_at, created_at) VALUES (?, ?, ?, ?)",
+                (kind, json.dumps(payload, ensure_ascii=False), now + delay, now),
+            )
+            return cursor.lastrowid
+        return await self._run(insert)
+
+    async def claim(self, kind: str, owner: str, limit: int, lease: float) -> list[Job]:
+        """Leases up to `limit` available jobs to `owner`, oldest first."""
+        def claim(conn: sqlite3.Connection) -> list[Job]:
+            now = time.time()
+            # IMMEDIATE takes the write lock up front, so two workers can't pick the same rows
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Abandoned on their last attempt, e.g. a message that crashes every worker
+                conn.execute("""
+                    UPDATE jobs SET status = 'failed', lease_owner = NULL,
+                        last_error = COALESCE(last_error, 'lease expired')
+                    WHERE kind = ? AND status = 'running' AND available_at <= ? AND attempts >= ?
+                """, (kind, now, self.max_attempts))
+                rows = conn.execute("""
+                    UPDATE jobs SET status = 'running', attempts = attempts + 1, available_at = ?, lease_owner = ?
+                    WHERE id IN (
+                        SELECT id FROM jobs WHERE kind = ? AND status != 'failed' AND available_at <= ?
+                        ORDER BY available_at, id LIMIT ?
+                    )
+                    RETURNING id, kind, payload, attempts
+                """, (now + lease, owner, kind, now, limit)).fetchall()
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            return sorted((Job(row[0], row[1], json.loads(row[2]), row[3]) for row in rows), key=lambda job: job.id)
+        return await self._run(claim)
+
+    async def heartbeat(self, job_ids: list[int], owner: str, lease: float) -> set[int]:
+        """Extends the leases `owner` still holds. Returns the ids that were extended."""
+        if not job_ids:
+            return set()
+        def renew(conn: sqlite3.Connection) -> set[int]:
+            placeholders = ",".join("?" * len(job_ids))
+            rows = conn.execute(
+                f"UPDATE jobs SET available_at = ? WHERE id IN ({placeholders}) AND lease_owner = ? AND status = 'running' "
+                "RETURNING id",
+                (time.time() + lease, *job_ids, owner),
+            ).fetchall()
+            return {row[0] for row in rows}
+        return await self._run(renew)
+
+    async def complete(self, job_id: int, owner: str) -> bool:
+        """Removes a finished job. False if the lease was lost and another worker may have it."""
+        def delete(conn: sqlite3.Connection) -> bool:
+            cursor = conn.execute("DELETE FROM jobs WHERE id = ? AND lease_owner = ?", (job_id, owner))
+            return cursor.rowcount > 0
+        return await self._run(delete)
+
+    async def fail(self, job_id: int, owner: str, error: str, retry_delay: float) -> None:
+        """Puts a job back after `retry_delay` seconds, or marks it failed after the last attempt."""
+        def update(conn: sqlite3.Connection):
+            conn.execute("""
+                UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'queued' END,
+                    available_at = ?, lease_owner = NULL, last_error = ?
+                WHERE id = ? AND lease_owner = ?
+            """, (self.max_attempts, time.time() + retry_delay, error[:500], job_id, owner))
+        await self._run(update)
+
+    async def release(self, job_ids: list[int], owner: str) -> None:
+        """Hands unfinished jobs back without counting the attempt, e.g. on shutdown."""
+        if not job_ids:
+            return
+        def update(conn: sqlite3.Connection):
+            placeholders = ",".join("?" * len(job_ids))
+            conn.execute(f"""
+                UPDATE jobs SET status = 'queued', attempts = MAX(attempts - 1, 0), available_at = ?, lease_owner = NULL
+                WHERE id IN ({placeholders}) AND lease_owner = ?
+            """, (time.time(), *job_ids, owner))
+        await self._run(update)
+
+    async def stats(self) -> dict[str, dict[str, int]]:
+        """Job counts per kind and status."""
+        def count(conn: sqlite3.Connection) -> dict:
+            result: dict[str, dict[str, int]] = {}
+            for kind, status, n in conn.execute("SELECT kind, status, COUNT(*) FROM jobs GROUP BY kind, status"):
+                result.setdefault(kind, {})[status] = n
+            return result
+        return await self._run(count)
+
+
+_queue: Optional[JobQueue] = None
+
+
+def get_queue() -> JobQueue:
+    """Returns the shared queue, opening tasks.db on first use."""
+    global _queue
+    if _queue is None:
+        _queue = JobQueue(config.DB_NAME, config.QUEUE_MAX_ATTEMPTS)
+    return _queue
+
+
+def set_queue(queue: JobQueue):
+    """Replaces the shared queue, e.g. with one on a temporary file for benchmarks."""
+    global _queue
+    _queue = queue
+
+
+async def init_queue() -> JobQueue:
+    queue = get_queue()
+    await queue.init()
+    logger.info("Job queue initialized.")
+    return queue
+
+
+async def close_queue():
+    global _queue
+    if _queue is not None:
+        await _queue.close()
+        _queue = None
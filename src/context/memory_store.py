@@ -0,0 +1,207 @@
+import asyncio
+import bisect
+import datetime
+from typing import AsyncIterator, Iterable, Optional
+
+from src.context.models import TASK_COLUMNS, Task, TaskSummary
+from src.context.store import CLOSED_STATUSES, DEFAULT_CHUNK_SIZE, to_epoch
+
+
+class InMemoryTaskStore:
+    """TaskStore that keeps everything in process memory.
+
+    Intended for tests and benchmarks of the ingest and command paths without
+    disk I/O. Pending ids and a sorted completed_ts index are maintained on
+    every write so reads never scan the whole table.
+    """
+
+    def __init__(self):
+        self._tasks: dict[int, dict] = {}
+        self._links: list[dict] = []
+        self._samples: list[dict] = []
+        self._rechecks: dict[int, dict] = {}
+        self._next_recheck_id = 1
+        self._chat_stats: dict[int, dict] = {}
+        self._pending_ids: dict[int, None] = {}  # insertion-ordered set
+        self._completed: list[tuple[int, int]] = []  # sorted (completed_ts, id)
+        self._next_id = 1
+
+    async def init(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+    async def add_task(self, task_data: dict) -> int:
+        task_id = self._next_id
+        self._next_id += 1
+        task = {
+            'id': task_id,
+            'source': task_data.get('source', 'telegram'),
+            'chat_id': task_data.get('chat_id'),
+            'message_id': task_data.get('message_id'),
+            'sender': task_data.get('sender'),
+            'content': task_data.get('content'),
+            'detected_at': task_data.get('detected_at', datetime.datetime.now().isoformat()),
+            'completed_at': task_data.get('completed_at', None),
+            'status': task_data.get('status', 'new'),
+            'tags': ",".join(task_data.get('tags', [])),
+        }
+        task['detected_ts'] = to_epoch(task['detected_at'])
+        task['completed_ts'] = to_epoch(task['completed_at'])
+        self._tasks[task_id] = task
+        self._index(task)
+        return task_id
+
+    def _index(self, task: dict):
+        if task['status'] == 'done':
+            bisect.insort(self._completed, (task['completed_ts'] or 0, task['id']))
+        elif task['status'] not in CLOSED_STATUSES:
+            self._pending_ids[task['id']] = None
+
+    def _unindex(self, task: dict):
+        if task['status'] == 'done':
+            key = (task['completed_ts'] or 0, task['id'])
+            pos = bisect.bisect_left(self._completed, key)
+            if pos < len(self._completed) and self._completed[pos] == key:
+                del self._completed[pos]
+        else:
+            self._pending_ids.pop(task['id'], None)
+
+    async def link_message_to_task(self, task_id: int, message_data: dict, similarity_score: float) -> None:
+        self._links.append({
+            'id': len(self._links) + 1,
+            'task_id': task_id,
+            'chat_id': message_data.get('chat_id'),
+            'message_id': message_data.get('message_id'),
+            'sender': message_data.get('sender'),
+            'content': message_data.get('content'),
+            'similarity': similarity_score,
+            'linked_at': message_data.get('detected_at', datetime.datetime.now().isoformat()),
+        })
+
+    async def get_pending_tasks(self) -> list[dict]:
+        return [dict(self._tasks[task_id]) for task_id in self._pending_ids]
+
+    async def get_completed_tasks(self, from_ts: Optional[int] = None, to_ts: Optional[int] = None) -> list[dict]:
+        return [dict(self._tasks[task_id]) for task_id in self._completed_ids(from_ts, to_ts)]
+
+    def _completed_ids(self, from_ts: Optional[int], to_ts: Optional[int]) -> list[int]:
+        start = bisect.bisect_left(self._completed, (from_ts, 0)) if from_ts is not None else 0
+        # Half-open range: (to_ts, 0) sorts before every task completed at to_ts
+        end = bisect.bisect_left(self._completed, (to_ts, 0)) if to_ts is not None else len(self._completed)
+        # Already in (completed_ts, id) order like the SQLite backend
+        return [task_id for _, task_id in self._completed[start:end]]
+
+    @staticmethod
+    def _to_task(task: dict) -> Task:
+        return Task(*(task[column] for column in TASK_COLUMNS))
+
+    @staticmethod
+    def _to_summary(task: dict, preview_len: int) -> TaskSummary:
+        return TaskSummary(task['id'], task['chat_id'], task['sender'], task['status'],
+                           (task['content'] or "")[:preview_len], task['completed_at'], task['completed_ts'])
+
+    async def _iter(self, task_ids: Iterable[int], convert, chunk_size: int) -> AsyncIterator:
+        for i, task_id in enumerate(task_ids, 1):
+            task = self._tasks.get(task_id)
+            if task is not None:
+                yield convert(task)
+            if i % chunk_size == 0:
+                # Yield to the event loop between chunks like the SQLite backend does
+                await asyncio.sleep(0)
+
+    def iter_tasks(self, from_ts: Optional[int] = None, to_ts: Optional[int] = None,
+                   chunk_size: int = DEFAULT_CHUNK_SIZE) -> AsyncIterator[Task]:
+        task_ids = [
+            task_id for task_id, task in self._tasks.items()
+            if (from_ts is None or (task['detected_ts'] or 0) >= from_ts)
+            and (to_ts is None or (task['detected_ts'] or 0) < to_ts)
+        ]
+        return self._iter(task_ids, self._to_task, chunk_size)
+
+    def iter_pending_tasks(self, chunk_size: int = DEFAULT_CHUNK_SIZE, after_id: int = 0) -> AsyncIterator[Task]:
+        return self._iter([task_id for task_id in self._pending_ids if task_id > after_id], self._to_task, chunk_size)
+
+    def iter_pending_summaries(self, preview_len: int = 50,
+                               chunk_size: int = DEFAULT_CHUNK_SIZE) -> AsyncIterator[TaskSummary]:
+        return self._iter(list(self._pending_ids), lambda task: self._to_summary(task, preview_len), chunk_size)
+
+    def iter_completed_tasks(self, from_ts: Optional[int] = None, to_ts: Optional[int] = None,
+                             chunk_size: int = DEFAULT_CHUNK_SIZE) -> AsyncIterator[Task]:
+        return self._iter(self._completed_ids(from_ts, to_ts), self._to_task, chunk_size)
+
+    def iter_completed_summaries(self, from_ts: Optional[int] = None, to_ts: Optional[int] = None,
+                                 preview_len: int = 50,
+                                 chunk_size: int = DEFAULT_CHUNK_SIZE) -> AsyncIterator[TaskSummary]:
+        return self._iter(self._completed_ids(from_ts, to_ts),
+                          lambda task: self._to_summary(task, preview_len), chunk_size)
+
+    async def get_task_by_id(self, task_id: int) -> Optional[dict]:
+        task = self._tasks.get(task_id)
+        return dict(task) if task else None
+
+    async def update_task_status(self, task_id: int, status: str, completed_at: datetime.datetime) -> None:
+        task = self._tasks.get(task_id)
+        if task is None:
+            return
+        self._unindex(task)
+        task['status'] = status
+        task['completed_at'] = completed_at.isoformat()
+        task['completed_ts'] = int(completed_at.timestamp())
+        self._index(task)
+
+    async def add_classifier_sample(self, content: str, is_task: bool, limit: int) -> None:
+        self._samples.append({'content': content, 'is_task': int(is_task), 'created_at': datetime.datetime.now().isoformat()})
+        if len(self._samples) > limit:
+            del self._samples[:len(self._samples) - limit]
+
+    async def add_recheck(self, recheck_data: dict) -> int:
+        recheck_id = self._next_recheck_id
+        self._next_recheck_id += 1
+        self._rechecks[recheck_id] = {
+            'id': recheck_id,
+            'chat_id': recheck_data.get('chat_id'),
+            'message_id': recheck_data.get('message_id'),
+            'sender': recheck_data.get('sender'),
+            'content': recheck_data.get('content'),
+            'fallback_is_task': int(recheck_data.get('fallback_is_task', False)),
+            'task_id': recheck_data.get('task_id'),
+            'created_at': recheck_data.get('created_at', datetime.datetime.now().isoformat()),
+        }
+        return recheck_id
+
+    async def get_rechecks(self, limit: int = 100) -> list[dict]:
+        return [dict(recheck) for recheck in list(self._rechecks.values())[:limit]]
+
+    async def delete_recheck(self, recheck_id: int) -> None:
+        self._rechecks.pop(recheck_id, None)
+
+    async def count_stale_tasks(self, before_ts: int) -> dict[int, int]:
+        counts: dict[int, int] = {}
+        for task_id in self._pending_ids:
+            task = self._tasks[task_id]
+            if task['detected_ts'] is not None and task['detected_ts'] < before_ts:
+                counts[task['chat_id']] = counts.get(task['chat_id'], 0) + 1
+        return counts
+
+    async def get_chat_stats(self) -> list[dict]:
+        return [dict(row) for row in self._chat_stats.values()]
+
+    async def save_chat_stats(self, rows: list[dict]) -> None:
+        for row in rows:
+            current = self._chat_stats.get(row['chat_id'])
+            if current is None:
+                self._chat_stats[row['chat_id']] = dict(row)
+                continue
+            current['chat_type'] = row['chat_type']
+            current['title'] = row['title'] or current['title']
+            for key in ('classified', 'tasks', 'done', 'dismissed', 'skipped', 'tokens_total'):
+                current[key] += row[key]
+            if row['tokens_day'] is None or (current['tokens_day'] or "") > row['tokens_day']:
+                continue
+            if current['tokens_day'] == row['tokens_day']:
+                current['tokens_today'] += row['tokens_today']
+            else:
+                current['tokens_day'] = row['tokens_day']
+                current['tokens_today'] = row['tokens_today']
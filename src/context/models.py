@@ -0,0 +1,35 @@
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass(slots=True)
+class Task:
+    """A full task row. Slotted, so a large result set costs far less than dicts."""
+    id: int
+    source: str
+    chat_id: int
+    message_id: int
+    sender: Optional[str]
+    content: str
+    detected_at: str
+    completed_at: Optional[str]
+    status: str
+    tags: Optional[str]
+    detected_ts: Optional[int]
+    completed_ts: Optional[int]
+
+
+@dataclass(slots=True)
+class TaskSummary:
+    """The columns needed to render a task in a list, with a truncated content preview."""
+    id: int
+    chat_id: int
+    sender: Optional[str]
+    status: str
+    preview: str
+    completed_at: Optional[str]
+    completed_ts: Optional[int]
+
+
+TASK_COLUMNS = ("id", "source", "chat_id", "message_id", "sender", "content",
+                "detected_at", "completed_at", "status", "tags", "detected_ts", "completed_ts")
@@ -0,0 +1,230 @@
+import os
+import re
+import zlib
+from typing import AsyncIterator, Callable, Optional, Protocol
+
+import numpy as np
+
+from src import config
+from src.context.models import Task
+from src.log import get_logger
+
+logger = get_logger("similarity")
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+_MENTION_RE = re.compile(r"@\w+")
+
+
+class Embedder(Protocol):
+    """Turns a message into a fixed-size, L2-normalised float32 vector."""
+    name: str
+    dim: int
+
+    def embed(self, text: str) -> np.ndarray: ...
+
+
+def _normalize_text(text: str) -> str:
+    # Mentions differ between groups for the same request, so drop them
+    return " ".join(_MENTION_RE.sub(" ", text).lower().split())
+
+
+class NgramEmbedder:
+    """Hashes character n-grams into a fixed number of buckets (feature hashing)."""
+    name = "ngram"
+
+    def __init__(self, dim: int = 512, n: int = 3):
+        self.dim = dim
+        self.n = n
+
+    def _features(self, text: str):
+        padded = f" {text} "
+        if len(padded) <= self.n:
+            yield padded
+            return
+        for i in range(len(padded) - self.n + 1):
+            yield padded[i:i + self.n]
+
+    def embed(self, text: str) -> np.ndarray:
+        vec = np.zeros(self.dim, dtype=np.float32)
+        for feature in self._features(_normalize_text(text)):
+            h = zlib.crc32(feature.encode("utf-8"))
+            # The sign bit keeps colliding features from only ever adding up
+            vec[h % self.dim] += 1.0 if (h >> 31) & 1 else -1.0
+        norm = float(np.linalg.norm(vec))
+        if norm > 0:
+            vec /= norm
+        return vec
+
+
+class HashingEmbedder(NgramEmbedder):
+    """Character n-grams plus whole words, so word order changes still match."""
+    name = "hashing"
+
+    def _features(self, text: str):
+        yield from super()._features(text)
+        for word in _WORD_RE.findall(text):
+            yield f"w:{word}"
+
+
+def create_embedder(name: str, dim: int, n: int) -> Embedder:
+    if name == "ngram":
+        return NgramEmbedder(dim, n)
+    if name == "hashing":
+        return HashingEmbedder(dim, n)
+    raise ValueError(f"Unknown embedder: {name}")
+
+
+def _signature(embedder: Embedder) -> str:
+    """Identifies the settings vectors were made with; any change makes them incomparable."""
+    return f"{embedder.name}:{embedder.dim}:{getattr(embedder, 'n', '')}"
+
+
+class TaskIndex:
+    """In-memory similarity index over pending tasks, backed by a NumPy matrix."""
+
+    def __init__(self, embedder: Embedder, capacity: int = 1024):
+        self.embedder = embedder
+        self._vectors = np.zeros((capacity, embedder.dim), dtype=np.float32)
+        self._ids = np.zeros(capacity, dtype=np.int64)
+        self._positions: dict[int, int] = {}
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, task_id: int) -> bool:
+        return task_id in self._positions
+
+    def _grow(self):
+        capacity = max(1024, len(self._ids) * 2)
+        vectors = np.zeros((capacity, self.embedder.dim), dtype=np.float32)
+        vectors[:self._size] = self._vectors[:self._size]
+        ids = np.zeros(capacity, dtype=np.int64)
+        ids[:self._size] = self._ids[:self._size]
+        self._vectors, self._ids = vectors, ids
+
+    def add(self, task_id: int, text: str):
+        self.add_vector(task_id, self.embedder.embed(text))
+
+    def add_vector(self, task_id: int, vector: np.ndarray):
+        if task_id in self._positions:
+            self._vectors[self._positions[task_id]] = vector
+            return
+        if self._size == len(self._ids):
+            self._grow()
+        self._vectors[self._size] = vector
+        self._ids[self._size] = task_id
+        self._positions[task_id] = self._size
+        self._size += 1
+
+    def remove(self, task_id: int):
+        pos = self._positions.pop(task_id, None)
+        if pos is None:
+            return
+        last = self._size - 1
+        if pos != last:
+            # Move the last row into the hole so the matrix stays dense
+            self._vectors[pos] = self._vectors[last]
+            self._ids[pos] = self._ids[last]
+            self._positions[int(self._ids[pos])] = pos
+        self._size = last
+
+    def search(self, text: str) -> tuple[Optional[int], float]:
+        """Returns the most similar task id and its cosine similarity."""
+        return self.search_vector(self.embedder.embed(text))
+
+    def search_vector(self, vector: np.ndarray) -> tuple[Optional[int], float]:
+        if self._size == 0:
+            return None, 0.0
+        scores = self._vectors[:self._size] @ vector
+        best = int(np.argmax(scores))
+        return int(self._ids[best]), float(scores[best])
+
+    def save(self, path: str):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, vectors=self._vectors[:self._size], ids=self._ids[:self._size],
+                     embedder=np.array(_signature(self.embedder)))
+        os.replace(tmp_path, path)
+
+    def load(self, path: str) -> bool:
+        """Loads a persisted index. Returns False if the file is missing, stale or
+        was built with a different embedder."""
+        try:
+            with np.load(path) as data:
+                vectors, ids, signature = data["vectors"], data["ids"], str(data["embedder"])
+        except (FileNotFoundError, KeyError, ValueError, OSError):
+            return False
+        if signature != _signature(self.embedder) or vectors.ndim != 2 or vectors.shape[1] != self.embedder.dim:
+            return False
+        self._vectors = np.zeros((max(1024, len(ids)), self.embedder.dim), dtype=np.float32)
+        self._ids = np.zeros(len(self._vectors), dtype=np.int64)
+        self._vectors[:len(ids)] = vectors
+        self._ids[:len(ids)] = ids
+        self._positions = {int(task_id): pos for pos, task_id in enumerate(ids)}
+        self._size = len(ids)
+        return True
+
+    def task_ids(self) -> set[int]:
+        return set(self._positions)
+
+
+_index: Optional[TaskIndex] = None
+# Highest pending task id the index has been synced up to
+_synced_id = 0
+
+
+def get_index() -> Optional[TaskIndex]:
+    """Returns the shared index, or None when duplicate detection is disabled."""
+    return _index
+
+
+async def init_index(pending_ids: set[int],
+                     iter_pending_tasks: Callable[[], AsyncIterator[Task]]) -> Optional[TaskIndex]:
+    """Loads the persisted index, rebuilding it if it doesn't match the pending tasks.
+
+    Task contents are only streamed from the database when a rebuild is needed.
+    """
+    global _index, _synced_id
+    if not config.DEDUP_ENABLED:
+        return None
+
+    embedder = create_embedder(config.DEDUP_EMBEDDER, config.DEDUP_DIM, config.DEDUP_NGRAM)
+    index = TaskIndex(embedder)
+    if not index.load(config.DEDUP_INDEX_PATH) or index.task_ids() != pending_ids:
+        index = TaskIndex(embedder)
+        async for task in iter_pending_tasks():
+            index.add(task.id, task.content)
+        logger.info("Rebuilt duplicate index with %d pending tasks.", len(index))
+    else:
+        logger.info("Loaded duplicate index with %d pending tasks.", len(index))
+    _index = index
+    _synced_id = max(index.task_ids(), default=0)
+    return _index
+
+
+async def sync_index(iter_pending_tasks: Callable[..., AsyncIterator[Task]]) -> int:
+    """Adds pending tasks that other worker processes created since the last sync.
+
+    Returns how many were added. Tasks they closed are noticed on a match instead.
+    """
+    global _synced_id
+    if _index is None:
+        return 0
+    added = 0
+    async for task in iter_pending_tasks(after_id=_synced_id):
+        _synced_id = max(_synced_id, task.id)
+        if task.id not in _index:
+            _index.add(task.id, task.content)
+            added += 1
+    return added
+
+
+def save_index():
+    if _index is None:
+        return
+    try:
+        _index.save(config.DEDUP_INDEX_PATH)
+        logger.info("Saved duplicate index with %d pending tasks.", len(_index))
+    except OSError as e:
+        logger.error("Error saving duplicate index: %s", e)
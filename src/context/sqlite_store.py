@@ -0,0 +1,392 @@
+import asyncio
+import datetime
+import sqlite3
+import threading
+from typing import AsyncIterator, Callable, Optional
+
+from src.context.models import TASK_COLUMNS, Task, TaskSummary
+from src.context.store import CLOSED_STATUSES, DEFAULT_CHUNK_SIZE, to_epoch
+
+_SUMMARY_SELECT = "id, chat_id, sender, status, substr(content, 1, ?), completed_at, completed_ts"
+
+# Bumped whenever _migrate() learns a new step; stored in PRAGMA user_version
+SCHEMA_VERSION = 1
+
+
+class SQLiteTaskStore:
+    """TaskStore backed by a SQLite file.
+
+    Queries run in a worker thread so disk I/O never blocks the event loop.
+    A single connection is shared and guarded by a lock. With `shared`, the
+    file is opened in WAL mode so ingest worker processes can write to it
+    alongside the bot.
+    """
+
+    def __init__(self, path: str, shared: bool = False):
+        self.path = path
+        self.shared = shared
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30 if self.shared else 5)
+            self._conn.row_factory = sqlite3.Row
+            if self.shared:
+                # Readers no longer block the writer, and commits skip the rollback journal
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute("PRAGMA synchronous=NORMAL")
+        return self._conn
+
+    async def _run(self, func, *args):
+        def call():
+            with self._lock:
+                return func(self._connect(), *args)
+        return await asyncio.to_thread(call)
+
+    async def init(self) -> None:
+        await self._run(self._init)
+
+    @staticmethod
+    def _init(conn: sqlite3.Connection):
+        cursor = conn.cursor()
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS tasks (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                source TEXT NOT NULL,
+                chat_id INTEGER NOT NULL,
+                message_id INTEGER NOT NULL,
+                sender TEXT,
+                content TEXT NOT NULL,
+                detected_at TEXT NOT NULL,
+                completed_at TEXT,
+                status TEXT NOT NULL,
+                tags TEXT,
+                detected_ts INTEGER,
+                completed_ts INTEGER
+            )
+        """)
+        SQLiteTaskStore._migrate(conn)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_tasks_status_completed_ts ON tasks (status, completed_ts)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_tasks_detected_ts ON tasks (detected_ts)")
+        # Messages that were recognised as a duplicate of an existing task
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS task_links (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                task_id INTEGER NOT NULL,
+                chat_id INTEGER NOT NULL,
+                message_id INTEGER NOT NULL,
+                sender TEXT,
+                content TEXT NOT NULL,
+                similarity REAL,
+                linked_at TEXT NOT NULL
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_task_links_task_id ON task_links (task_id)")
+        # LLM-labelled messages used to train the offline fallback classifier
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS classifier_samples (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                content TEXT NOT NULL,
+                is_task INTEGER NOT NULL,
+                created_at TEXT NOT NULL
+            )
+        """)
+        # Messages classified by the fallback while the LLM was unavailable
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS rechecks (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                chat_id INTEGER NOT NULL,
+                message_id INTEGER NOT NULL,
+                sender TEXT,
+                content TEXT NOT NULL,
+                fallback_is_task INTEGER NOT NULL,
+                task_id INTEGER,
+                created_at TEXT NOT NULL
+            )
+        """)
+        # Per-chat classification counters for the LLM budget
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS chat_stats (
+                chat_id INTEGER PRIMARY KEY,
+                chat_type TEXT NOT NULL,
+                title TEXT,
+                classified INTEGER NOT NULL DEFAULT 0,
+                tasks INTEGER NOT NULL DEFAULT 0,
+                done INTEGER NOT NULL DEFAULT 0,
+                dismissed INTEGER NOT NULL DEFAULT 0,
+                skipped INTEGER NOT NULL DEFAULT 0,
+                tokens_day TEXT,
+                tokens_today INTEGER NOT NULL DEFAULT 0,
+                tokens_total INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        conn.commit()
+
+    @staticmethod
+    def _migrate(conn: sqlite3.Connection):
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version < 1:
+            # v1: integer epoch columns next to the ISO strings, backfilled from them.
+            # The strings were written with naive datetime.now(), i.e. the host's local time.
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(tasks)")}
+            for column in ("detected_ts", "completed_ts"):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE tasks ADD COLUMN {column} INTEGER")
+            last_id = 0
+            while True:
+                rows = conn.execute(
+                    "SELECT id, detected_at, completed_at FROM tasks WHERE id > ? ORDER BY id LIMIT 5000",
+                    (last_id,)
+                ).fetchall()
+                if not rows:
+                    break
+                conn.executemany(
+                    "UPDATE tasks SET detected_ts = ?, completed_ts = ? WHERE id = ?",
+                    [(to_epoch(detected_at), to_epoch(completed_at), task_id) for task_id, detected_at, completed_at in rows]
+                )
+                last_id = rows[-1][0]
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        conn.commit()
+
+    async def close(self) -> None:
+        def close():
+            with self._lock:
+                if self._conn is not None:
+                    self._conn.close()
+                    self._conn = None
+        await asyncio.to_thread(close)
+
+    async def add_task(self, task_data: dict) -> int:
+        return await self._run(self._add_task, task_data)
+
+    @staticmethod
+    def _add_task(conn: sqlite3.Connection, task_data: dict) -> int:
+        cursor = conn.execute("""
+            INSERT INTO tasks (source, chat_id, message_id, sender, content, detected_at, completed_at, status, tags,
+                               detected_ts, completed_ts)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (
+            task_data.get('source', 'telegram'),
+            task_data.get('chat_id'),
+            task_data.get('message_id'),
+            task_data.get('sender'),
+            task_data.get('content'),
+            detected_at := task_data.get('detected_at', datetime.datetime.now().isoformat()),
+            completed_at := task_data.get('completed_at', None),
+            task_data.get('status', 'new'),
+            ",".join(task_data.get('tags', [])),
+            to_epoch(detected_at),
+            to_epoch(completed_at)
+        ))
+        conn.commit()
+        return cursor.lastrowid
+
+    async def link_message_to_task(self, task_id: int, message_data: dict, similarity_score: float) -> None:
+        await self._run(self._link_message_to_task, task_id, message_data, similarity_score)
+
+    @staticmethod
+    def _link_message_to_task(conn: sqlite3.Connection, task_id: int, message_data: dict, similarity_score: float):
+        conn.execute("""
+            INSERT INTO task_links (task_id, chat_id, message_id, sender, content, similarity, linked_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (
+            task_id,
+            message_data.get('chat_id'),
+            message_data.get('message_id'),
+            message_data.get('sender'),
+            message_data.get('content'),
+            similarity_score,
+            message_data.get('detected_at', datetime.datetime.now().isoformat())
+        ))
+        conn.commit()
+
+    async def get_pending_tasks(self) -> list[dict]:
+        where, params = self._pending_filter()
+        return await self._run(self._fetch_all, f"SELECT * FROM tasks WHERE {where}", params)
+
+    async def get_completed_tasks(self, from_ts: Optional[int] = None, to_ts: Optional[int] = None) -> list[dict]:
+        where, params = self._completed_filter(from_ts, to_ts)
+        return await self._run(self._fetch_all, f"SELECT * FROM tasks WHERE {where} ORDER BY completed_ts, id", params)
+
+    @staticmethod
+    def _pending_filter() -> tuple[str, tuple]:
+        placeholders = ", ".join("?" for _ in CLOSED_STATUSES)
+        return f"status NOT IN ({placeholders})", CLOSED_STATUSES
+
+    @staticmethod
+    def _completed_filter(from_ts: Optional[int], to_ts: Optional[int]) -> tuple[str, tuple]:
+        # Matches idx_tasks_status_completed_ts, so ranges are index range scans
+        where = "status = 'done'"
+        params = []
+        if from_ts is not None:
+            where += " AND completed_ts >= ?"
+            params.append(from_ts)
+        if to_ts is not None:
+            where += " AND completed_ts < ?"
+            params.append(to_ts)
+        return where, tuple(params)
+
+    async def _iter_rows(self, select: str, select_params: tuple, where: str, params: tuple,
+                         factory: Callable, chunk_size: int, by_completion: bool = False,
+                         after: Optional[tuple] = None) -> AsyncIterator:
+        """Streams rows with keyset pagination.
+
+        Each chunk is a separate short query, so the lock isn't held while the
+        caller processes rows and writes in between are never blocked. Pages
+        follow id order, or (completed_ts, id) which walks the completion index.
+        `after` starts the scan past a known key instead of at the beginning.
+        """
+        order = "completed_ts, id" if by_completion else "id"
+        first_query = f"SELECT {select} FROM tasks WHERE {where} ORDER BY {order} LIMIT ?"
+        next_query = f"SELECT {select} FROM tasks WHERE {where} AND ({order}) > ({'?, ?' if by_completion else '?'}) ORDER BY {order} LIMIT ?"
+
+        def fetch_chunk(conn: sqlite3.Connection, last_key: Optional[tuple]) -> list:
+            if last_key is None:
+                rows = conn.execute(first_query, select_params + params + (chunk_size,)).fetchall()
+            else:
+                rows = conn.execute(next_query, select_params + params + last_key + (chunk_size,)).fetchall()
+            return [factory(*row) for row in rows]
+
+        last_key = after
+        while True:
+            chunk = await self._run(fetch_chunk, last_key)
+            for item in chunk:
+                yield item
+            if len(chunk) < chunk_size:
+                return
+            last = chunk[-1]
+            last_key = (last.completed_ts, last.id) if by_completion else (last.id,)
+
+    def iter_tasks(self, from_ts: Optional[int] = None, to_ts: Optional[int] = None,
+                   chunk_size: int = DEFAULT_CHUNK_SIZE) -> AsyncIterator[Task]:
+        where = "1 = 1"
+        params = []
+        if from_ts is not None:
+            where += " AND detected_ts >= ?"
+            params.append(from_ts)
+        if to_ts is not None:
+            where += " AND detected_ts < ?"
+            params.append(to_ts)
+        return self._iter_rows(", ".join(TASK_COLUMNS), (), where, tuple(params), Task, chunk_size)
+
+    def iter_pending_tasks(self, chunk_size: int = DEFAULT_CHUNK_SIZE, after_id: int = 0) -> AsyncIterator[Task]:
+        where, params = self._pending_filter()
+        return self._iter_rows(", ".join(TASK_COLUMNS), (), where, params, Task, chunk_size,
+                               after=(after_id,) if after_id else None)
+
+    def iter_pending_summaries(self, preview_len: int = 50,
+                               chunk_size: int = DEFAULT_CHUNK_SIZE) -> AsyncIterator[TaskSummary]:
+        where, params = self._pending_filter()
+        return self._iter_rows(_SUMMARY_SELECT, (preview_len,), where, params, TaskSummary, chunk_size)
+
+    def iter_completed_tasks(self, from_ts: Optional[int] = None, to_ts: Optional[int] = None,
+                             chunk_size: int = DEFAULT_CHUNK_SIZE) -> AsyncIterator[Task]:
+        where, params = self._completed_filter(from_ts, to_ts)
+        return self._iter_rows(", ".join(TASK_COLUMNS), (), where, params, Task, chunk_size, by_completion=True)
+
+    def iter_completed_summaries(self, from_ts: Optional[int] = None, to_ts: Optional[int] = None,
+                                 preview_len: int = 50,
+                                 chunk_size: int = DEFAULT_CHUNK_SIZE) -> AsyncIterator[TaskSummary]:
+        where, params = self._completed_filter(from_ts, to_ts)
+        return self._iter_rows(_SUMMARY_SELECT, (preview_len,), where, params, TaskSummary, chunk_size,
+                               by_completion=True)
+
+    @staticmethod
+    def _fetch_all(conn: sqlite3.Connection, query: str, params: tuple) -> list[dict]:
+        return [dict(row) for row in conn.execute(query, params).fetchall()]
+
+    async def get_task_by_id(self, task_id: int) -> Optional[dict]:
+        def fetch(conn: sqlite3.Connection):
+            row = conn.execute("SELECT * FROM tasks WHERE id = ?", (task_id,)).fetchone()
+            return dict(row) if row else None
+        return await self._run(fetch)
+
+    async def update_task_status(self, task_id: int, status: str, completed_at: datetime.datetime) -> None:
+        def update(conn: sqlite3.Connection):
+            conn.execute(
+                "UPDATE tasks SET status = ?, completed_at = ?, completed_ts = ? WHERE id = ?",
+                (status, completed_at.isoformat(), int(completed_at.timestamp()), task_id)
+            )
+            conn.commit()
+        await self._run(update)
+
+    async def add_classifier_sample(self, content: str, is_task: bool, limit: int) -> None:
+        def add(conn: sqlite3.Connection):
+            cursor = conn.execute(
+                "INSERT INTO classifier_samples (content, is_task, created_at) VALUES (?, ?, ?)",
+                (content, int(is_task), datetime.datetime.now().isoformat())
+            )
+            # Trim occasionally rather than on every insert
+            if cursor.lastrowid % 100 == 0:
+                conn.execute("DELETE FROM classifier_samples WHERE id <= ?", (cursor.lastrowid - limit,))
+            conn.commit()
+        await self._run(add)
+
+    async def add_recheck(self, recheck_data: dict) -> int:
+        def add(conn: sqlite3.Connection) -> int:
+            cursor = conn.execute("""
+                INSERT INTO rechecks (chat_id, message_id, sender, content, fallback_is_task, task_id, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (
+                recheck_data.get('chat_id'),
+                recheck_data.get('message_id'),
+                recheck_data.get('sender'),
+                recheck_data.get('content'),
+                int(recheck_data.get('fallback_is_task', False)),
+                recheck_data.get('task_id'),
+                recheck_data.get('created_at', datetime.datetime.now().isoformat())
+            ))
+            conn.commit()
+            return cursor.lastrowid
+        return await self._run(add)
+
+    async def get_rechecks(self, limit: int = 100) -> list[dict]:
+        return await self._run(self._fetch_all, "SELECT * FROM rechecks ORDER BY id LIMIT ?", (limit,))
+
+    async def delete_recheck(self, recheck_id: int) -> None:
+        def delete(conn: sqlite3.Connection):
+            conn.execute("DELETE FROM rechecks WHERE id = ?", (recheck_id,))
+            conn.commit()
+        await self._run(delete)
+
+    async def count_stale_tasks(self, before_ts: int) -> dict[int, int]:
+        where, params = self._pending_filter()
+        def count(conn: sqlite3.Connection) -> dict[int, int]:
+            rows = conn.execute(
+                f"SELECT chat_id, COUNT(*) FROM tasks WHERE {where} AND detected_ts < ? GROUP BY chat_id",
+                params + (before_ts,)
+            ).fetchall()
+            return dict(rows)
+        return await self._run(count)
+
+    async def get_chat_stats(self) -> list[dict]:
+        return await self._run(self._fetch_all, "SELECT * FROM chat_stats", ())
+
+    async def save_chat_stats(self, rows: list[dict]) -> None:
+        def save(conn: sqlite3.Connection):
+            # Additive so several worker processes can each flush their own increments
+            conn.executemany("""
+                INSERT INTO chat_stats
+                    (chat_id, chat_type, title, classified, tasks, done, dismissed, skipped,
+                     tokens_day, tokens_today, tokens_total)
+                VALUES (:chat_id, :chat_type, :title, :classified, :tasks, :done, :dismissed, :skipped,
+                        :tokens_day, :tokens_today, :tokens_total)
+                ON CONFLICT (chat_id) DO UPDATE SET
+                    chat_type = excluded.chat_type,
+                    title = COALESCE(excluded.title, title),
+                    classified = classified + excluded.classified,
+                    tasks = tasks + excluded.tasks,
+                    done = done + excluded.done,
+                    dismissed = dismissed + excluded.dismissed,
+                    skipped = skipped + excluded.skipped,
+                    tokens_today = CASE
+                        WHEN excluded.tokens_day IS NULL THEN tokens_today
+                        WHEN tokens_day IS excluded.tokens_day THEN tokens_today + excluded.tokens_today
+                        WHEN tokens_day > excluded.tokens_day THEN tokens_today
+                        ELSE excluded.tokens_today END,
+                    tokens_day = MAX(COALESCE(tokens_day, ''), COALESCE(excluded.tokens_day, '')),
+                    tokens_total = tokens_total + excluded.tokens_total
+            """, rows)
+            conn.commit()
+        await self._run(save)
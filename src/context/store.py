@@ -0,0 +1,107 @@
+from datetime import datetime
+from typing import AsyncIterator, Optional, Protocol
+
+from src.context.models import Task, TaskSummary
+
+# Statuses that take a task off the pending list. 'dismissed' is used when the
+# LLM later overrules a task created by the offline fallback classifier.
+CLOSED_STATUSES = ("done", "dismissed")
+
+# Rows fetched per query by the iter_* methods
+DEFAULT_CHUNK_SIZE = 500
+
+
+def to_epoch(iso: Optional[str]) -> Optional[int]:
+    """Converts a stored ISO timestamp to Unix seconds. Naive values are read as host-local time."""
+    if not iso:
+        return None
+    return int(datetime.fromisoformat(iso).timestamp())
+
+
+class TaskStore(Protocol):
+    """Storage backend for tasks. See sqlite_store and memory_store for implementations."""
+
+    async def init(self) -> None:
+        """Prepares the backend (creates tables, loads data, ...)."""
+        ...
+
+    async def close(self) -> None:
+        """Releases any resources held by the backend."""
+        ...
+
+    async def add_task(self, task_data: dict) -> int:
+        """Adds a new task and returns its id."""
+        ...
+
+    async def link_message_to_task(self, task_id: int, message_data: dict, similarity_score: float) -> None:
+        """Records a message as a duplicate of an existing task."""
+        ...
+
+    async def get_pending_tasks(self) -> list[dict]:
+        """Returns all tasks that are not closed (see CLOSED_STATUSES)."""
+        ...
+
+    async def get_completed_tasks(self, from_ts: Optional[int] = None, to_ts: Optional[int] = None) -> list[dict]:
+        """Returns tasks marked as 'done' with from_ts <= completed_ts < to_ts, oldest completion first."""
+        ...
+
+    def iter_tasks(self, from_ts: Optional[int] = None, to_ts: Optional[int] = None,
+                   chunk_size: int = DEFAULT_CHUNK_SIZE) -> AsyncIterator[Task]:
+        """Streams tasks of any status in id order, optionally detected within [from_ts, to_ts)."""
+        ...
+
+    def iter_pending_tasks(self, chunk_size: int = DEFAULT_CHUNK_SIZE, after_id: int = 0) -> AsyncIterator[Task]:
+        """Streams pending tasks with id > after_id in id order, fetching `chunk_size` rows at a time."""
+        ...
+
+    def iter_pending_summaries(self, preview_len: int = 50,
+                               chunk_size: int = DEFAULT_CHUNK_SIZE) -> AsyncIterator[TaskSummary]:
+        """Like iter_pending_tasks, but only loads the columns and content preview needed for lists."""
+        ...
+
+    def iter_completed_tasks(self, from_ts: Optional[int] = None, to_ts: Optional[int] = None,
+                             chunk_size: int = DEFAULT_CHUNK_SIZE) -> AsyncIterator[Task]:
+        """Streams done tasks in completion order, optionally limited to [from_ts, to_ts) in Unix seconds."""
+        ...
+
+    def iter_completed_summaries(self, from_ts: Optional[int] = None, to_ts: Optional[int] = None,
+                                 preview_len: int = 50,
+                                 chunk_size: int = DEFAULT_CHUNK_SIZE) -> AsyncIterator[TaskSummary]:
+        """Projection variant of iter_completed_tasks."""
+        ...
+
+    async def get_task_by_id(self, task_id: int) -> Optional[dict]:
+        """Returns a single task, or None if it doesn't exist."""
+        ...
+
+    async def update_task_status(self, task_id: int, status: str, completed_at: datetime) -> None:
+        """Updates the status of a task, storing completed_at as both ISO string and epoch seconds."""
+        ...
+
+    async def add_classifier_sample(self, content: str, is_task: bool, limit: int) -> None:
+        """Stores an LLM-labelled message for training the fallback classifier, keeping the newest `limit`."""
+        ...
+
+    async def add_recheck(self, recheck_data: dict) -> int:
+        """Flags a message classified while the LLM was unavailable, returns the recheck id."""
+        ...
+
+    async def get_rechecks(self, limit: int = 100) -> list[dict]:
+        """Returns the oldest messages waiting to be re-classified."""
+        ...
+
+    async def delete_recheck(self, recheck_id: int) -> None:
+        """Removes a message from the recheck queue."""
+        ...
+
+    async def count_stale_tasks(self, before_ts: int) -> dict[int, int]:
+        """Counts pending tasks detected before `before_ts`, per chat_id."""
+        ...
+
+    async def get_chat_stats(self) -> list[dict]:
+        """Returns the persisted per-chat classification counters."""
+        ...
+
+    async def save_chat_stats(self, rows: list[dict]) -> None:
+        """Adds per-chat counter increments, one row per chat_id. tokens_today restarts with a newer tokens_day."""
+        ...
@@ -0,0 +1,353 @@
+"""Per-chat LLM budget driven by how often each chat actually yields tasks.
+
+Every classified message updates its chat's counters (messages classified,
+tasks found, tasks later marked done, dismissed or left open, tokens spent). From those
+a smoothed score is derived that sets the chat's daily token cap and its
+place in the queue for Gemini: private chats first, then groups and channels
+by score. Chats over their cap are classified by the offline fallback model.
+
+Several worker processes may share tasks.db, so each process saves only the
+increments since its last flush and then reloads the combined counters.
+"""
+import asyncio
+import datetime
+import heapq
+import itertools
+from dataclasses import asdict, dataclass
+from typing import Optional
+
+from src import config
+from src.context import database
+from src.context.store import CLOSED_STATUSES
+from src.ingest import rules
+from src.llm import client as llm_client
+from src.log import get_logger
+
+logger = get_logger("llm")
+
+# Tag on tasks found by the fallback classifier because the chat was over budget
+BUDGET_TAG = "budget"
+
+
+@dataclass(slots=True)
+class ChatStats:
+    chat_id: int
+    chat_type: str
+    title: Optional[str] = None
+    classified: int = 0
+    tasks: int = 0
+    done: int = 0
+    dismissed: int = 0
+    # Messages the fallback classified because the chat was over budget
+    skipped: int = 0
+    tokens_day: Optional[str] = None
+    tokens_today: int = 0
+    tokens_total: int = 0
+    # Tasks left pending for longer than llm.budget.ignore_after_days; refreshed, not stored
+    ignored: int = 0
+
+    def to_row(self) -> dict:
+        row = asdict(self)
+        del row['ignored']
+        return row
+
+    def yield_rate(self) -> float:
+        """Share of classified messages that were tasks, pulled towards the prior for new chats."""
+        weight = config.LLM_PRIOR_WEIGHT
+        return (self.tasks + config.LLM_PRIOR_YIELD * weight) / (self.classified + weight)
+
+    def done_rate(self) -> float:
+        """Share of settled tasks the user completed rather than dismissed or ignored."""
+        return (self.done + 1) / (self.done + self.dismissed + self.ignored + 2)
+
+    def score(self) -> float:
+        return self.yield_rate() * self.done_rate()
+
+    def factor(self) -> float:
+        """Multiplier on the base daily cap; 1 for a chat that looks like the prior."""
+        prior = config.LLM_PRIOR_YIELD * 0.5
+        return min(config.LLM_BUDGET_MAX_FACTOR, max(config.LLM_BUDGET_MIN_FACTOR, self.score() / prior))
+
+    def daily_cap(self) -> Optional[int]:
+        """Tokens this chat may spend today, None if uncapped."""
+        if self.chat_type == rules.PRIVATE:
+            return None
+        return int(config.LLM_CHAT_DAILY_TOKENS * self.factor())
+
+    def add_tokens(self, tokens: int, today: str):
+        if self.tokens_day != today:
+            self.tokens_day = today
+            self.tokens_today = 0
+        self.tokens_today += tokens
+        self.tokens_total += tokens
+
+    def merge(self, delta: "ChatStats"):
+        """Adds unsaved increments, the same way save_chat_stats combines them."""
+        self.chat_type = delta.chat_type
+        self.title = delta.title or self.title
+        for name in ('classified', 'tasks', 'done', 'dismissed', 'skipped', 'tokens_total'):
+            setattr(self, name, getattr(self, name) + getattr(delta, name))
+        if delta.tokens_day is None or (self.tokens_day or "") > delta.tokens_day:
+            return
+        if self.tokens_day == delta.tokens_day:
+            self.tokens_today += delta.tokens_today
+        else:
+            self.tokens_day = delta.tokens_day
+            self.tokens_today = delta.tokens_today
+
+
+class PriorityGate:
+    """Limits concurrent LLM calls; waiters are admitted lowest priority value first."""
+
+    def __init__(self, limit: int):
+        self._limit = limit
+        self._active = 0
+        self._waiters: list[tuple[tuple, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    @property
+    def waiting(self) -> int:
+        return sum(1 for _, _, future in self._waiters if not future.done())
+
+    async def acquire(self, priority: tuple):
+        if self._active < self._limit and not self._waiters:
+            self._active += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            # The slot may have been handed over just before the cancellation
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        self._active -= 1
+        while self._waiters and self._active < self._limit:
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                continue  # cancelled while waiting
+            self._active += 1
+            future.set_result(None)
+
+
+class BudgetManager:
+    """Holds the per-chat counters and decides whether and when a message may use the LLM."""
+
+    def __init__(self):
+        self._stats: dict[int, ChatStats] = {}
+        # Increments not yet written, per chat
+        self._deltas: dict[int, ChatStats] = {}
+        self._gate = PriorityGate(config.LLM_CONCURRENCY)
+        self._global_day: Optional[str] = None
+        self._global_today = 0
+
+    def __len__(self) -> int:
+        return len(self._stats)
+
+    @staticmethod
+    def _today() -> str:
+        return datetime.datetime.now(config.settings().tz()).date().isoformat()
+
+    def load(self, rows: list[dict]):
+        """Takes the saved counters, keeping increments that are not saved yet on top."""
+        for row in rows:
+            stats = self._stats.get(row['chat_id'])
+            if stats is None:
+                stats = self._stats[row['chat_id']] = ChatStats(**row)
+            else:
+                # Updated in place: classify() may hold the object across an await
+                for name, value in row.items():
+                    setattr(stats, name, value)
+            delta = self._deltas.get(stats.chat_id)
+            if delta is not None:
+                stats.merge(delta)
+
+        today = self._today()
+        self._global_day = today
+        self._global_today = sum(stats.tokens_today for stats in self._stats.values()
+                                 if stats.chat_type != rules.PRIVATE and stats.tokens_day == today)
+
+    def _delta(self, stats: ChatStats) -> ChatStats:
+        delta = self._deltas.get(stats.chat_id)
+        if delta is None:
+            delta = self._deltas[stats.chat_id] = ChatStats(stats.chat_id, stats.chat_type)
+        delta.chat_type = stats.chat_type
+        delta.title = stats.title
+        return delta
+
+    def _count(self, stats: ChatStats, name: str):
+        setattr(stats, name, getattr(stats, name) + 1)
+        delta = self._delta(stats)
+        setattr(delta, name, getattr(delta, name) + 1)
+
+    def _get(self, chat_id: int, chat_type: str, title: Optional[str] = None) -> ChatStats:
+        stats = self._stats.get(chat_id)
+        if stats is None:
+            stats = self._stats[chat_id] = ChatStats(chat_id, chat_type)
+        stats.chat_type = chat_type
+        if title:
+            stats.title = title
+        return stats
+
+    def _add_global(self, tokens: int, today: str):
+        if self._global_day != today:
+            self._global_day = today
+            self._global_today = 0
+        self._global_today += tokens
+
+    def _record_tokens(self, stats: ChatStats, tokens: int):
+        today = self._today()
+        stats.add_tokens(tokens, today)
+        self._delta(stats).add_tokens(tokens, today)
+        if stats.chat_type != rules.PRIVATE:
+            self._add_global(tokens, today)
+
+    def over_budget(self, stats: ChatStats) -> bool:
+        if stats.chat_type == rules.PRIVATE:
+            return False
+        today = self._today()
+        used = stats.tokens_today if stats.tokens_day == today else 0
+        if used >= stats.daily_cap():
+            return True
+        global_used = self._global_today if self._global_day == today else 0
+        return 0 < config.LLM_DAILY_TOKENS <= global_used
+
+    @staticmethod
+    def priority(stats: ChatStats) -> tuple:
+        return (0 if stats.chat_type == rules.PRIVATE else 1, -stats.score())
+
+    async def classify(self, chat_id: int, chat_type: str, title: Optional[str], text: str) -> llm_client.Classification:
+        """Classifies a message within the chat's budget and records the outcome."""
+        stats = self._get(chat_id, chat_type, title)
+        if config.LLM_BUDGET_ENABLED and self.over_budget(stats):
+            logger.debug("Chat over LLM budget, using fallback.", extra={"chat_id": chat_id})
+            classification = llm_client.Classification(llm_client.fallback_is_task(text), over_budget=True)
+        elif config.LLM_BUDGET_ENABLED:
+            await self._gate.acquire(self.priority(stats))
+            try:
+                classification = await llm_client.classify(text)
+            finally:
+                self._gate.release()
+        else:
+            classification = await llm_client.classify(text)
+
+        # Only the LLM's verdicts count towards the yield
+        if classification.over_budget:
+            self._count(stats, 'skipped')
+        elif classification.from_llm:
+            self._count(stats, 'classified')
+            if classification.is_task:
+                self._count(stats, 'tasks')
+        self._record_tokens(stats, classification.tokens)
+        return classification
+
+    def record_usage(self, chat_id: int, tokens: int):
+        """Charges tokens spent outside classify(), e.g. by a recheck, to a known chat."""
+        stats = self._stats.get(chat_id)
+        if stats is not None:
+            self._record_tokens(stats, tokens)
+
+    def on_status_change(self, task: dict, status: str):
+        """database status listener: counts tasks the user completed or that were dismissed."""
+        stats = self._stats.get(task['chat_id'])
+        if stats is None or task['status'] in CLOSED_STATUSES:
+            return
+        if status in ("done", "dismissed"):
+            self._count(stats, status)
+
+    def set_ignored(self, counts: dict[int, int]):
+        for stats in self._stats.values():
+            stats.ignored = counts.get(stats.chat_id, 0)
+
+    async def refresh_ignored(self):
+        """Recounts tasks the user has left pending for too long."""
+        cutoff = datetime.datetime.now() - datetime.timedelta(days=config.LLM_IGNORE_AFTER_DAYS)
+        self.set_ignored(await database.count_stale_tasks(int(cutoff.timestamp())))
+
+    async def flush(self):
+        """Adds the increments since the last flush to the database and reloads the totals,
+        which include what other processes have saved in the meantime."""
+        if self._deltas:
+            deltas, self._deltas = self._deltas, {}
+            try:
+                await database.save_chat_stats([delta.to_row() for delta in deltas.values()])
+            except Exception:
+                for chat_id, delta in deltas.items():
+                    newer = self._deltas.get(chat_id)
+                    if newer is not None:
+                        delta.merge(newer)
+                    self._deltas[chat_id] = delta
+                raise
+        self.load(await database.get_chat_stats())
+
+    def stats(self) -> dict:
+        today = self._today()
+        chats = []
+        for rank, stats in enumerate(sorted(self._stats.values(), key=self.priority), 1):
+            chats.append({
+                **asdict(stats),
+                "tokens_today": stats.tokens_today if stats.tokens_day == today else 0,
+                "yield": stats.yield_rate(),
+                "done_rate": stats.done_rate(),
+                "daily_cap": stats.daily_cap(),
+                "rank": rank,
+            })
+        return {
+            "global_today": self._global_today if self._global_day == today else 0,
+            "global_cap": config.LLM_DAILY_TOKENS or None,
+            "active": self._gate.active,
+            "waiting": self._gate.waiting,
+            "chats": chats,
+        }
+
+
+_manager = BudgetManager()
+_flush_task: Optional[asyncio.Task] = None
+
+
+def get_manager() -> BudgetManager:
+    return _manager
+
+
+async def _flush_loop(interval: float):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await _manager.flush()
+            await _manager.refresh_ignored()
+        except Exception as e:
+            logger.error("Failed to save chat stats: %s", e)
+
+
+async def init():
+    """Loads saved counters, tracks task status changes and starts periodic saving."""
+    global _flush_task
+    _manager.load(await database.get_chat_stats())
+    await _manager.refresh_ignored()
+    database.on_status_change(_manager.on_status_change)
+    _flush_task = asyncio.create_task(_flush_loop(config.LLM_STATS_FLUSH_INTERVAL))
+    logger.info("LLM budget loaded for %d chats.", len(_manager))
+
+
+async def close():
+    """Stops periodic saving and writes the remaining changes."""
+    global _flush_task
+    if _flush_task:
+        _flush_task.cancel()
+        _flush_task = None
+    await _manager.flush()
+
+
+async def classify(chat_id: int, chat_type: str, title: Optional[str], text: str) -> llm_client.Classification:
+    return await _manager.classify(chat_id, chat_type, title, text)
+
+
+def record_usage(chat_id: int, tokens: int):
+    _manager.record_usage(chat_id, tokens)
@@ -2,22 +2,21 @@ from telethon import events, TelegramClient
 from telethon.tl.types import User
 import datetime
 import re
+from typing import Awaitable, Callable, Optional
 from telegram import Bot
 
 from src import config
-from src.llm import client as llm_client
 from src.context import database
+from src.context import job_queue
+from src.context import similarity
+from src.context.store import CLOSED_STATUSES
+from src.bot import outbound
+from src.ingest import budget
+from src.ingest import recheck
+from src.ingest import rules
+from src.log import get_logger
 
-def is_ignored_group(event, chat):
-    """Checks if the message is from an ignored group."""
-    group_id = event.chat_id
-    chat_title = getattr(chat, 'title', '')
-    chat_username = getattr(chat, 'username', '')
-
-    if event.is_group:
-        if group_id in config.IGNORE_GROUPS or chat_title in config.IGNORE_GROUPS or chat_username in config.IGNORE_GROUPS:
-            return True
-    return False
+logger = get_logger("ingest")
 
 async def is_tagged(event, me: User):
     """Checks if the user was mentioned in the message."""
@@ -52,60 +51,102 @@ def get_sender_name(sender):
         return "Unknown"
     if isinstance(sender, User):
         return sender.first_name or sender.last_name or sender.username or "Unknown"
-    return "Unknown"
+    # Channel posts are sent by the channel itself
+    return getattr(sender, 'title', None) or "Unknown"
 
-async def create_task_from_event(event, sender_name: str):
-    """Creates a task dictionary from a message event and returns the task id."""
-    task_data = {
-        'source': 'telegram',
+def build_message(event, chat, chat_type: str, sender_name: str, text: str) -> dict:
+    """Captures what processing needs from a message as plain data, so it can be queued."""
+    return {
         'chat_id': event.chat_id,
+        'chat_type': chat_type,
+        'chat_title': getattr(chat, 'title', None),
         'message_id': event.message.id,
         'sender': sender_name,
-        'content': event.message.message,
-        'detected_at': datetime.datetime.now().isoformat(),
+        'text': text,
+        'detected_at': datetime.datetime.now().astimezone().isoformat(),
+    }
+
+async def create_task_from_message(message: dict, settings: config.Settings, tags: Optional[list] = None):
+    """Creates a task from a built message and returns the task id."""
+    task_data = {
+        'source': 'telegram',
+        'chat_id': message['chat_id'],
+        'message_id': message['message_id'],
+        'sender': message['sender'],
+        'content': message['text'],
+        'detected_at': message['detected_at'],
         'completed_at': None,
         'status': 'new',
-        'tags': []
+        'tags': tags or []
     }
+    return await create_task(task_data, settings)
+
+async def create_task(task_data: dict, settings: config.Settings):
+    """Adds a task and returns its id.
+
+    If the message is a near-duplicate of a pending task, it is linked to that
+    task instead and the existing id is returned.
+    """
+    index = similarity.get_index()
+    vector = None
+    if index is not None and task_data['content']:
+        vector = index.embedder.embed(task_data['content'])
+        while True:
+            existing_id, score = index.search_vector(vector)
+            if existing_id is None or score < settings.dedup_threshold:
+                break
+            existing = await database.get_task_by_id(existing_id)
+            if existing and existing['status'] not in CLOSED_STATUSES:
+                await database.link_message_to_task(existing_id, task_data, score)
+                return existing_id
+            # Closed by another process since this index added it
+            index.remove(existing_id)
+
     task_id = await database.add_task(task_data)
+    if vector is not None:
+        index.add_vector(task_id, vector)
     return task_id
 
 # This function will be registered as the event handler
 async def handle_message(event: events.NewMessage.Event, client: TelegramClient, bot: Bot):
     """The main message handler."""
+    # Take one snapshot so a config reload mid-message can't mix old and new settings
+    settings = config.settings()
     chat = await event.get_chat()
     me = await client.get_me()
 
     # Ensure we have a valid user object for "me"
     if not isinstance(me, User):
-        print("Could not retrieve valid 'me' user object. Aborting.")
+        logger.error("Could not retrieve valid 'me' user object. Aborting.")
         return
 
-    if is_ignored_group(event, chat):
+    chat_type = rules.chat_type_of(event)
+    rule = settings.filters.route(event.chat_id, chat_type, chat)
+    if rule.action == rules.IGNORE:
         return
 
     text = event.message.message or ""
     # Filter my message being forwarded
     # 1. if the message content is the canned reply, ignore it
-    if text.strip() == config.TASK_ADDED_REPLY:
-        print("Ignoring canned reply message.")
+    if outbound.strip_task_ids(text.strip()).strip() == settings.task_added_reply:
+        logger.debug("Ignoring canned reply message.", extra={"chat_id": event.chat_id})
         return
     # 2. if the message is forwarded and the original sender_id is myself
     if getattr(event.message, 'forward', None):
         forward_sender_id = getattr(getattr(event.message.forward, 'sender', None), 'id', None) or \
                             getattr(event.message.forward, 'sender_id', None)
         if forward_sender_id == getattr(me, 'id', None):
-            print("Ignoring forwarded canned reply from myself.")
+            logger.debug("Ignoring forwarded canned reply from myself.", extra={"chat_id": event.chat_id})
             return
 
     sender = await event.get_sender()
     # Ignore messages from bots
     if getattr(sender, 'bot', False):
-        print(f"Ignoring message from bot: {getattr(sender, 'username', 'Unknown')}")
+        logger.debug("Ignoring message from bot: %s", getattr(sender, 'username', 'Unknown'), extra={"chat_id": event.chat_id})
         return
     # Ignore messages sent by myself
     if getattr(sender, 'id', None) == getattr(me, 'id', None):
-        print("Ignoring message sent by myself.")
+        logger.debug("Ignoring message sent by myself.", extra={"chat_id": event.chat_id})
         # 新增：自動處理 /done 指令
         match = re.match(r"/done\\s+(\\d+)", text.strip())
         if match and bot:
@@ -113,29 +154,66 @@ async def handle_message(event: events.NewMessage.Event, client: TelegramClient,
             task = await database.get_task_by_id(task_id)
             if task:
                 await database.update_task_status(task_id, "done")
-                await bot.send_message(chat_id=sender.id, text=f"✅ 任務 {task_id} 已標記為完成！")
-                print(f"Task {task_id} marked as done by myself via /done command.")
+                await outbound.send(outbound.BOT, sender.id, f"✅ 任務 {task_id} 已標記為完成！",
+                                    lambda text: bot.send_message(chat_id=sender.id, text=text))
+                logger.info("Task %s marked as done by myself via /done command.", task_id, extra={"task_id": task_id})
             else:
-                await bot.send_message(chat_id=sender.id, text=f"找不到任務 {task_id}，請確認編號是否正確。")
+                await outbound.send(outbound.BOT, sender.id, f"找不到任務 {task_id}，請確認編號是否正確。",
+                                    lambda text: bot.send_message(chat_id=sender.id, text=text))
             return
 
     sender_name = get_sender_name(sender)
-    
-    should_process = False
-    if event.is_private:
-        # For private chats, check with LLM
-        if await llm_client.is_task(text):
-            should_process = True
-    elif await is_tagged(event, me):
-        # For groups, only process if mentioned
-        if await llm_client.is_task(text):
-            should_process = True
-
-    if should_process:
-        print(f"Detected potential task from {sender_name} in chat {event.chat_id}.")
-        task_id = await create_task_from_event(event, sender_name)
-        # Optionally, send a confirmation reply
-        if config.ENABLE_REPLY_IN_PRIVATE and event.is_private:
-            await event.reply(f"{config.TASK_ADDED_REPLY}\n({task_id})")
-        elif config.ENABLE_REPLY and not event.is_private:
-            await event.reply(f"{config.TASK_ADDED_REPLY}\n({task_id})") 
\ No newline at end of file
+
+    # Cheap rule conditions first so filtered messages never cost an LLM call
+    if not rule.admits(text, sender):
+        logger.debug("Message filtered by rule %s.", rule.name, extra={"chat_id": event.chat_id})
+        return
+    if rule.action == rules.TAGGED and not await is_tagged(event, me):
+        return
+
+    message = build_message(event, chat, chat_type, sender_name, text)
+    if config.QUEUE_ENABLED:
+        # Workers take it from here; the reply comes back as a reply job
+        await job_queue.get_queue().enqueue(job_queue.MESSAGE, message)
+        return
+
+    async def send_reply(task_id: int):
+        # Queued so a burst of tasks can't trigger FloodWait and stall this handler
+        await outbound.send_confirmation(outbound.USER, event.chat_id, settings.task_added_reply, task_id, event.reply)
+
+    await process_message(message, settings, send_reply)
+
+async def process_message(message: dict, settings: config.Settings, send_reply: Callable[[int], Awaitable]):
+    """Classifies a message that passed the filters, stores it as a task and asks for a confirmation.
+
+    Runs in the Telegram process, or in an ingest worker when the job queue is enabled.
+    """
+    chat_id, chat_type, text = message['chat_id'], message['chat_type'], message['text']
+    classification = await budget.classify(chat_id, chat_type, message['chat_title'], text)
+
+    task_id = None
+    if classification.is_task:
+        logger.info("Detected potential task from %s.", message['sender'],
+                    extra={"chat_id": chat_id, "degraded": classification.degraded})
+        # Tasks found by the fallback classifier are tagged so a later LLM recheck may dismiss them
+        tags = [recheck.FALLBACK_TAG] if classification.degraded or classification.llm_disabled else \
+            [budget.BUDGET_TAG] if classification.over_budget else []
+        task_id = await create_task_from_message(message, settings, tags)
+        # Optionally, send a confirmation reply.
+        # Broadcast channels are read-only sources, so never reply there
+        if (settings.enable_reply_in_private and chat_type == rules.PRIVATE) or \
+                (settings.enable_reply and chat_type == rules.GROUP):
+            await send_reply(task_id)
+
+    if classification.degraded:
+        # Let the LLM take another look once it is reachable again
+        await database.add_recheck({
+            'chat_id': chat_id,
+            'message_id': message['message_id'],
+            'sender': message['sender'],
+            'content': text,
+            'fallback_is_task': classification.is_task,
+            'task_id': task_id,
+        })
+    elif classification.from_llm:
+        await database.add_classifier_sample(text, classification.is_task) 
\ No newline at end of file
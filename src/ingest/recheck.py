@@ -0,0 +1,106 @@
+import asyncio
+import datetime
+from typing import Optional
+
+from src import config
+from src.context import database
+from src.context.store import CLOSED_STATUSES
+from src.ingest import budget
+from src.llm import client as llm_client
+from src.log import get_logger
+
+logger = get_logger("ingest")
+
+# Tag on tasks created by the fallback classifier while the LLM was unavailable
+FALLBACK_TAG = "fallback"
+# Tag on tasks the fallback missed and the LLM found on recheck
+RECHECK_TAG = "recheck"
+
+_recheck_task: Optional[asyncio.Task] = None
+
+
+async def _apply(recheck: dict, is_task: bool):
+    """Reconciles the fallback's decision with the LLM's."""
+    task_id = recheck['task_id']
+    if is_task and not task_id:
+        # Imported here, the handler imports this module for FALLBACK_TAG
+        from src.ingest.handler import create_task
+        task_id = await create_task({
+            'source': 'telegram',
+            'chat_id': recheck['chat_id'],
+            'message_id': recheck['message_id'],
+            'sender': recheck['sender'],
+            'content': recheck['content'],
+            'detected_at': recheck['created_at'],
+            'completed_at': None,
+            'status': 'new',
+            'tags': [RECHECK_TAG],
+        }, config.settings())
+        logger.info("Recheck found a task the fallback missed.", extra={"chat_id": recheck['chat_id'], "task_id": task_id})
+    elif not is_task and task_id:
+        task = await database.get_task_by_id(task_id)
+        # Only dismiss tasks the fallback created, never one it was linked to as a duplicate
+        if task and FALLBACK_TAG in (task['tags'] or "").split(",") and task['status'] not in CLOSED_STATUSES:
+            await database.update_task_status(task_id, "dismissed")
+            logger.info("Recheck dismissed a fallback task.", extra={"chat_id": recheck['chat_id'], "task_id": task_id})
+    await database.add_classifier_sample(recheck['content'], is_task)
+
+
+async def recheck_degraded(batch_size: int = 50):
+    """Re-classifies messages the fallback handled, until the queue is empty or the LLM fails again."""
+    started = datetime.datetime.now()
+    checked = 0
+    while True:
+        rechecks = await database.get_rechecks(batch_size)
+        if not rechecks:
+            break
+        for recheck in rechecks:
+            try:
+                is_task, tokens = await llm_client.ask_llm(recheck['content'])
+            except Exception as e:
+                # Circuit opened again or the request failed; the rest waits for the next recovery
+                logger.warning("Recheck paused after %d messages: %s", checked, e)
+                return
+            budget.record_usage(recheck['chat_id'], tokens)
+            await _apply(recheck, is_task)
+            await database.delete_recheck(recheck['id'])
+            checked += 1
+    if checked:
+        logger.info("Rechecked %d messages classified while the LLM was unavailable.", checked,
+                    extra={"duration_s": (datetime.datetime.now() - started).total_seconds()})
+
+
+def schedule_recheck():
+    """Starts a recheck in the background unless one is already running."""
+    global _recheck_task
+    if not llm_client.model:
+        return
+    if _recheck_task is None or _recheck_task.done():
+        _recheck_task = asyncio.create_task(recheck_degraded())
+
+
+async def stop():
+    """Cancels a running recheck; unfinished messages stay queued for the next start."""
+    global _recheck_task
+    if _recheck_task is not None and not _recheck_task.done():
+        _recheck_task.cancel()
+        await asyncio.gather(_recheck_task, return_exceptions=True)
+    _recheck_task = None
+
+
+async def poll(interval: float):
+    """Schedules a recheck every `interval` seconds while the LLM is up.
+
+    The breaker only reports a recovery to the process that saw the outage,
+    so with several workers the recheck worker also looks on a timer.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        if llm_client.breaker.is_closed:
+            schedule_recheck()
+
+
+def install():
+    """Rechecks leftovers from a previous run now, and again whenever the LLM recovers."""
+    llm_client.breaker.on_close(schedule_recheck)
+    schedule_recheck()
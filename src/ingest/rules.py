@@ -0,0 +1,198 @@
+"""Per-chat filter rules deciding which incoming messages reach the classifier.
+
+Rules come from the `filters` section of config.yaml and are compiled once per
+config load into a RuleSet: chat ids go into a dict, username/title globs into
+precompiled regexes, and per-type defaults into a fallback table. Pattern
+results are memoized per chat type, username and title, so routing a message
+is a couple of dict lookups and a renamed chat is matched again.
+"""
+import fnmatch
+import re
+from dataclasses import dataclass
+from typing import Optional
+
+# Actions
+CLASSIFY = "classify"  # send every admitted message to the classifier
+TAGGED = "tagged"      # only messages that mention or reply to me
+IGNORE = "ignore"      # drop without spending an LLM call
+ACTIONS = (CLASSIFY, TAGGED, IGNORE)
+
+# Chat types
+PRIVATE = "private"
+GROUP = "group"
+CHANNEL = "channel"
+CHAT_TYPES = (PRIVATE, GROUP, CHANNEL)
+
+# Matches the behaviour before rules existed; channels are opt-in
+DEFAULT_ACTIONS = {PRIVATE: CLASSIFY, GROUP: TAGGED, CHANNEL: IGNORE}
+
+
+@dataclass(frozen=True)
+class Rule:
+    """A compiled rule. `keywords` and `senders` further gate messages the action lets through."""
+    name: str
+    action: str
+    keywords: Optional[re.Pattern] = None
+    sender_ids: frozenset = frozenset()
+    sender_names: frozenset = frozenset()
+
+    def admits(self, text: str, sender) -> bool:
+        """Checks the keyword and sender allowlist conditions."""
+        if self.sender_ids or self.sender_names:
+            username = (getattr(sender, 'username', None) or "").lower()
+            if getattr(sender, 'id', None) not in self.sender_ids and username not in self.sender_names:
+                return False
+        if self.keywords is not None and not self.keywords.search(text):
+            return False
+        return True
+
+
+@dataclass(frozen=True)
+class _PatternRule:
+    rule: Rule
+    chat_type: Optional[str]
+    username: Optional[re.Pattern]
+    title: Optional[re.Pattern]
+
+    def matches(self, chat_type: str, username: str, title: str) -> bool:
+        if self.chat_type and self.chat_type != chat_type:
+            return False
+        if self.username and not self.username.match(username):
+            return False
+        if self.title and not self.title.match(title):
+            return False
+        return True
+
+
+class RuleSet:
+    """Dispatch table from chats to rules. Precedence: chat id, then first matching pattern, then chat type."""
+
+    def __init__(self, by_id: dict[int, Rule], patterns: list[_PatternRule], by_type: dict[str, Rule],
+                 group_ids: Optional[dict[int, Rule]] = None):
+        self._by_id = by_id
+        self._patterns = patterns
+        self._by_type = by_type
+        # Id rules that only apply to groups, ahead of by_id
+        self._group_ids = group_ids or {}
+        # (chat_type, username, title) -> Rule. Reset on reload because a reload builds a new RuleSet.
+        self._resolved: dict[tuple[str, str, str], Rule] = {}
+
+    def route(self, chat_id: int, chat_type: str, chat) -> Rule:
+        """Returns the rule for a chat, caching pattern results by the chat's current name."""
+        rule = self._group_ids.get(chat_id) if chat_type == GROUP else None
+        if rule is None:
+            rule = self._by_id.get(chat_id)
+        if rule is not None:
+            return rule
+        key = (chat_type, (getattr(chat, 'username', None) or "").lower(), getattr(chat, 'title', None) or "")
+        rule = self._resolved.get(key)
+        if rule is None:
+            rule = self._resolve(*key)
+            self._resolved[key] = rule
+        return rule
+
+    def _resolve(self, chat_type: str, username: str, title: str) -> Rule:
+        for pattern in self._patterns:
+            if pattern.matches(chat_type, username, title):
+                return pattern.rule
+        return self._by_type[chat_type]
+
+
+def _glob(value, key: str, where: str) -> Optional[re.Pattern]:
+    if value is None:
+        return None
+    if not isinstance(value, str) or not value:
+        raise ValueError(f"{where}.{key} must be a non-empty glob string")
+    return re.compile(fnmatch.translate(value.lstrip("@") if key == "username" else value), re.IGNORECASE)
+
+
+def _compile_rule(raw: dict, where: str) -> Rule:
+    action = raw.get("action", CLASSIFY)
+    if action not in ACTIONS:
+        raise ValueError(f"{where}.action must be one of {', '.join(ACTIONS)}, got {action!r}")
+
+    keywords = raw.get("keywords") or []
+    if not isinstance(keywords, list) or not all(isinstance(k, str) and k for k in keywords):
+        raise ValueError(f"{where}.keywords must be a list of strings")
+    senders = raw.get("senders") or []
+    if not isinstance(senders, list) or not all(isinstance(s, (int, str)) for s in senders):
+        raise ValueError(f"{where}.senders must be a list of user IDs or usernames")
+
+    return Rule(
+        name=str(raw.get("name", where)),
+        action=action,
+        # One alternation instead of a loop over keywords per message
+        keywords=re.compile("|".join(map(re.escape, keywords)), re.IGNORECASE) if keywords else None,
+        sender_ids=frozenset(s for s in senders if isinstance(s, int)),
+        sender_names=frozenset(s.lstrip("@").lower() for s in senders if isinstance(s, str)),
+    )
+
+
+def compile_rules(raw: dict, ignore_groups: list) -> RuleSet:
+    """Validates the `filters` config section and compiles it. Raises ValueError on bad input.
+
+    `ignore_groups` is the legacy bot_settings list; its entries become ignore
+    rules for groups, ahead of any configured rule.
+    """
+    by_type = {chat_type: Rule(f"default:{chat_type}", action) for chat_type, action in DEFAULT_ACTIONS.items()}
+    for chat_type in CHAT_TYPES:
+        if chat_type in raw:
+            action = raw[chat_type]
+            if action not in ACTIONS:
+                raise ValueError(f"{chat_type} must be one of {', '.join(ACTIONS)}, got {action!r}")
+            by_type[chat_type] = Rule(f"default:{chat_type}", action)
+
+    by_id: dict[int, Rule] = {}
+    group_ids: dict[int, Rule] = {}
+    patterns: list[_PatternRule] = []
+
+    legacy = Rule("bot_settings.ignore_groups", IGNORE)
+    for entry in ignore_groups:
+        if isinstance(entry, int):
+            group_ids[entry] = legacy
+        else:
+            # Titles and usernames were compared verbatim
+            exact = re.compile(re.escape(entry) + r"\Z")
+            patterns.append(_PatternRule(legacy, GROUP, None, exact))
+            patterns.append(_PatternRule(legacy, GROUP, re.compile(re.escape(entry.lower()) + r"\Z"), None))
+
+    rules = raw.get("rules") or []
+    if not isinstance(rules, list):
+        raise ValueError("rules must be a list")
+    for i, entry in enumerate(rules):
+        where = f"rules[{i}]"
+        if not isinstance(entry, dict):
+            raise ValueError(f"{where} must be a mapping")
+        rule = _compile_rule(entry, where)
+
+        chat_type = entry.get("type")
+        if chat_type is not None and chat_type not in CHAT_TYPES:
+            raise ValueError(f"{where}.type must be one of {', '.join(CHAT_TYPES)}, got {chat_type!r}")
+
+        chats = entry.get("chat")
+        if chats is not None:
+            chats = chats if isinstance(chats, list) else [chats]
+            if not all(isinstance(c, int) and not isinstance(c, bool) for c in chats):
+                raise ValueError(f"{where}.chat must be a chat ID or a list of chat IDs")
+            for chat_id in chats:
+                # Earlier rules win, like patterns
+                by_id.setdefault(chat_id, rule)
+        elif "username" in entry or "title" in entry:
+            patterns.append(_PatternRule(rule, chat_type,
+                                         _glob(entry.get("username"), "username", where),
+                                         _glob(entry.get("title"), "title", where)))
+        elif chat_type is not None:
+            by_type[chat_type] = rule
+        else:
+            raise ValueError(f"{where} needs one of chat, username, title or type")
+
+    return RuleSet(by_id, patterns, by_type, group_ids)
+
+
+def chat_type_of(event) -> str:
+    """Maps a Telethon event to PRIVATE, GROUP or CHANNEL (broadcast channels only)."""
+    if event.is_private:
+        return PRIVATE
+    if event.is_group:
+        return GROUP
+    return CHANNEL
@@ -0,0 +1,312 @@
+"""Ingest worker: processes messages the Telegram process put on the job queue.
+
+With `queue.enabled`, the Telegram process only applies the cheap filters and
+enqueues each remaining message. Workers (`python worker.py`, as many
+processes as needed) claim message jobs, classify them within the LLM budget,
+store tasks and enqueue confirmation replies, which the Telegram process sends
+through its outbound dispatcher because only it holds the user session.
+"""
+import argparse
+import asyncio
+import os
+import signal
+import socket
+import time
+from typing import Optional
+
+from telethon import TelegramClient
+
+from src import config
+from src import log
+from src.bot import outbound
+from src.config_watcher import watch_config
+from src.context import database
+from src.context import job_queue
+from src.context import similarity
+from src.ingest import budget
+from src.ingest import recheck
+from src.ingest.handler import process_message
+
+logger = log.get_logger("queue")
+
+
+def _retry_delay(attempts: int) -> float:
+    return min(300.0, 2.0 ** attempts)
+
+
+class Worker:
+    """Keeps up to `batch_size` message jobs in flight and their leases renewed."""
+
+    def __init__(self, queue: job_queue.JobQueue, owner: str, batch_size: int = config.QUEUE_BATCH_SIZE,
+                 lease: float = config.QUEUE_LEASE, heartbeat: float = config.QUEUE_HEARTBEAT,
+                 poll_interval: float = config.QUEUE_POLL_INTERVAL):
+        self.queue = queue
+        self.owner = owner
+        self.batch_size = batch_size
+        self.lease = lease
+        self.heartbeat = heartbeat
+        self.poll_interval = poll_interval
+        self.stopping = asyncio.Event()
+        self.processed = 0
+        self.failed = 0
+        self._running: dict[int, asyncio.Task] = {}
+        # Running jobs whose completion or failure is being written
+        self._settling: set[int] = set()
+
+    def stop(self):
+        self.stopping.set()
+
+    async def _process(self, job: job_queue.Job):
+        message = job.payload
+        # One snapshot per message, as in the Telegram process
+        settings = config.settings()
+
+        async def send_reply(task_id: int):
+            await self.queue.enqueue(job_queue.REPLY, {
+                'chat_id': message['chat_id'],
+                'message_id': message['message_id'],
+                'task_id': task_id,
+                'text': settings.task_added_reply,
+            })
+
+        try:
+            # Other workers may have created tasks this message duplicates
+            await similarity.sync_index(database.iter_pending_tasks)
+            await process_message(message, settings, send_reply)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.failed += 1
+            logger.exception("Job %d failed (attempt %d): %s", job.id, job.attempts, e,
+                             extra={"chat_id": message.get('chat_id')})
+            self._settling.add(job.id)
+            await self.queue.fail(job.id, self.owner, repr(e), _retry_delay(job.attempts))
+            return
+        self._settling.add(job.id)
+        if not await self.queue.complete(job.id, self.owner):
+            # The lease ran out mid-job, so another worker may process it again
+            logger.warning("Lost the lease on job %d before it finished.", job.id,
+                           extra={"chat_id": message.get('chat_id')})
+        self.processed += 1
+
+    def _start(self, job: job_queue.Job):
+        task = asyncio.create_task(self._process(job), name=f"job-{job.id}")
+        self._running[job.id] = task
+        task.add_done_callback(lambda _: (self._running.pop(job.id, None), self._settling.discard(job.id)))
+
+    async def _heartbeat_loop(self):
+        while True:
+            await asyncio.sleep(self.heartbeat)
+            job_ids = list(self._running)
+            try:
+                renewed = await self.queue.heartbeat(job_ids, self.owner, self.lease)
+            except Exception as e:
+                logger.error("Failed to renew job leases: %s", e)
+                continue
+            # Jobs that completed while the renewal ran are gone, not lost
+            lost = [job_id for job_id in job_ids
+                    if job_id not in renewed and job_id in self._running and job_id not in self._settling]
+            if lost:
+                logger.warning("Lost the lease on %d running jobs.", len(lost), extra={"job_ids": lost})
+
+    async def run(self, exit_when_empty: bool = False, max_jobs: Optional[int] = None):
+        """Claims and processes message jobs until stopped.
+
+        With `exit_when_empty` it returns once the queue is empty, and with
+        `max_jobs` after that many jobs.
+        """
+        heartbeat = asyncio.create_task(self._heartbeat_loop(), name="job-heartbeat")
+        stopping = asyncio.ensure_future(self.stopping.wait())
+        started = 0
+        try:
+            while not self.stopping.is_set():
+                free = self.batch_size - len(self._running)
+                if max_jobs is not None:
+                    free = min(free, max_jobs - started)
+                jobs = []
+                if free > 0:
+                    try:
+                        jobs = await self.queue.claim(job_queue.MESSAGE, self.owner, free, self.lease)
+                    except Exception as e:
+                        logger.error("Failed to claim jobs: %s", e)
+                for job in jobs:
+                    self._start(job)
+                started += len(jobs)
+
+                if not self._running and ((exit_when_empty and not jobs) or
+                                          (max_jobs is not None and started >= max_jobs)):
+                    break
+                # A full claim means more may be waiting, so only poll once the queue looked empty
+                full = len(self._running) >= self.batch_size or (max_jobs is not None and started >= max_jobs)
+                await asyncio.wait({*self._running.values(), stopping},
+                                   timeout=None if full else self.poll_interval,
+                                   return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            stopping.cancel()
+            heartbeat.cancel()
+            await self._drain()
+
+    async def _drain(self):
+        """Lets running jobs finish within the ingest drain timeout and hands the rest back."""
+        if not self._running:
+            return
+        tasks = dict(self._running)
+        logger.info("Waiting for %d running jobs.", len(tasks))
+        _, pending = await asyncio.wait(tasks.values(), timeout=config.SHUTDOWN_INGEST_DRAIN)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.wait(pending, timeout=1)
+        unfinished = [job_id for job_id, task in tasks.items() if task in pending]
+        if unfinished:
+            await self.queue.release(unfinished, self.owner)
+            logger.warning("Released %d unfinished jobs back to the queue.", len(unfinished))
+
+
+class ReplyRelay:
+    """Sends the confirmations workers asked for. Runs in the Telegram process.
+
+    A reply job is completed only after its message was actually sent. While
+    it waits in the outbound dispatcher its lease is renewed; a failed send is
+    retried later, and jobs still unsent when the relay stops are released
+    for the next start.
+    """
+
+    def __init__(self, client: TelegramClient, queue: job_queue.JobQueue, owner: str,
+                 lease: float = config.QUEUE_LEASE, heartbeat: float = config.QUEUE_HEARTBEAT,
+                 poll_interval: float = config.QUEUE_POLL_INTERVAL):
+        self.client = client
+        self.queue = queue
+        self.owner = owner
+        self.lease = lease
+        self.heartbeat = heartbeat
+        self.poll_interval = poll_interval
+        self._in_flight: dict[int, job_queue.Job] = {}
+        self._results: list[tuple[job_queue.Job, Optional[Exception]]] = []
+        self._wakeup = asyncio.Event()
+
+    def _on_done(self, job: job_queue.Job):
+        # Called by the dispatcher; the queue is updated from run() instead of its send loop
+        def done(error: Optional[Exception]):
+            self._results.append((job, error))
+            self._wakeup.set()
+        return done
+
+    async def _settle(self):
+        results, self._results = self._results, []
+        for job, error in results:
+            self._in_flight.pop(job.id, None)
+            if error is None:
+                await self.queue.complete(job.id, self.owner)
+            else:
+                await self.queue.fail(job.id, self.owner, repr(error), _retry_delay(job.attempts))
+
+    async def _submit(self, jobs: list[job_queue.Job]):
+        for job in jobs:
+            if job.id in self._in_flight:
+                continue  # lease ran out while it waited in the dispatcher; it is still queued there
+            self._in_flight[job.id] = job
+            reply = job.payload
+            chat_id, message_id = reply['chat_id'], reply['message_id']
+            try:
+                await outbound.send_confirmation(
+                    outbound.USER, chat_id, reply['text'], reply['task_id'],
+                    lambda text, chat_id=chat_id, message_id=message_id:
+                        self.client.send_message(chat_id, text, reply_to=message_id),
+                    on_done=self._on_done(job))
+            except Exception as e:
+                # Sent directly because the dispatcher is gone; on_done recorded the failure
+                logger.error("Failed to send reply for job %d: %s", job.id, e, extra={"chat_id": chat_id})
+
+    async def run(self, stopping: asyncio.Event):
+        """Claims reply jobs until `stopping` is set, then only settles sends until cancelled."""
+        renewed_at = time.monotonic()
+        try:
+            while True:
+                self._wakeup.clear()
+                jobs = []
+                try:
+                    await self._settle()
+                    if not stopping.is_set():
+                        jobs = await self.queue.claim(job_queue.REPLY, self.owner, 50, self.lease)
+                        await self._submit(jobs)
+                    if self._in_flight and time.monotonic() - renewed_at >= self.heartbeat:
+                        await self.queue.heartbeat(list(self._in_flight), self.owner, self.lease)
+                        renewed_at = time.monotonic()
+                except Exception as e:
+                    logger.error("Reply relay failed: %s", e)
+                if not jobs:
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+        finally:
+            await self._settle()
+            if self._in_flight:
+                await self.queue.release(list(self._in_flight), self.owner)
+                logger.warning("Released %d unsent replies back to the queue.", len(self._in_flight))
+
+
+async def relay_replies(client: TelegramClient, stopping: asyncio.Event):
+    """Runs a ReplyRelay on the shared queue until cancelled."""
+    relay = ReplyRelay(client, job_queue.get_queue(), f"{socket.gethostname()}:{os.getpid()}:relay")
+    await relay.run(stopping)
+
+
+async def run_worker(owner: Optional[str] = None, run_recheck: bool = False,
+                     exit_when_empty: bool = False, max_jobs: Optional[int] = None) -> Worker:
+    """Sets up storage, the duplicate index and the LLM budget, then processes jobs until stopped."""
+    await database.init_db()
+    pending_ids = {task.id async for task in database.iter_pending_summaries(preview_len=0)}
+    await similarity.init_index(pending_ids, database.iter_pending_tasks)
+    await budget.init()
+    queue = await job_queue.init_queue()
+
+    worker = Worker(queue, owner or f"{socket.gethostname()}:{os.getpid()}")
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, worker.stop)
+        except NotImplementedError:
+            pass
+
+    watcher = asyncio.create_task(watch_config(), name="config-watcher") if config.CONFIG_WATCH else None
+    poller = None
+    if run_recheck:
+        # Only one worker should recheck, or messages would be rechecked twice
+        recheck.install()
+        poller = asyncio.create_task(recheck.poll(config.QUEUE_RECHECK_INTERVAL), name="recheck-poll")
+    logger.info("Worker %s started.", worker.owner, extra={"batch_size": worker.batch_size})
+    try:
+        await worker.run(exit_when_empty, max_jobs)
+    finally:
+        if watcher:
+            watcher.cancel()
+        if poller:
+            poller.cancel()
+        await recheck.stop()
+        await budget.close()
+        # The duplicate index file belongs to the Telegram process; workers rebuild theirs on start
+        await job_queue.close_queue()
+        await database.close_db()
+        logger.info("Worker %s stopped.", worker.owner,
+                    extra={"processed": worker.processed, "failed": worker.failed})
+    return worker
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Processes queued Telegram messages (queue.enabled in config.yaml).")
+    parser.add_argument("--id", help="worker name used for job leases (default: host:pid)")
+    parser.add_argument("--recheck", action="store_true",
+                        help="also re-classify messages handled by the fallback; enable on one worker only")
+    parser.add_argument("--exit-when-empty", action="store_true", help="stop once the queue is empty")
+    parser.add_argument("--max-jobs", type=int, help="stop after this many jobs")
+    args = parser.parse_args()
+
+    log.setup_logging()
+    try:
+        if not config.QUEUE_ENABLED:
+            logger.warning("queue.enabled is false; the Telegram process handles messages itself.")
+        await run_worker(args.id, args.recheck, args.exit_when_empty, args.max_jobs)
+    finally:
+        log.shutdown_logging()
@@ -0,0 +1,104 @@
+import asyncio
+import time
+from typing import Awaitable, Callable, Optional, TypeVar
+
+from src.log import get_logger
+
+logger = get_logger("llm")
+
+T = TypeVar("T")
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the wrapped service while the circuit is open."""
+
+
+class CircuitBreaker:
+    """Stops calling a slow or failing service until it has had time to recover.
+
+    Errors, timeouts and calls slower than `latency_threshold` count as
+    failures. After `failure_threshold` consecutive failures the circuit opens
+    and calls fail fast for `reset_timeout` seconds. Then one probe call is let
+    through (half-open); if it succeeds the circuit closes again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 3, latency_threshold: float = 5.0,
+                 reset_timeout: float = 30.0, call_timeout: float = 10.0):
+        self.failure_threshold = failure_threshold
+        self.latency_threshold = latency_threshold
+        self.reset_timeout = reset_timeout
+        self.call_timeout = call_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._close_listeners: list[Callable[[], None]] = []
+
+    def on_close(self, listener: Callable[[], None]):
+        """Registers a callback invoked when the circuit recovers."""
+        self._close_listeners.append(listener)
+
+    def allow(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+            logger.info("Circuit half-open, probing LLM.")
+        if self.state == self.HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def _record_success(self):
+        self._failures = 0
+        self._probe_in_flight = False
+        if self.state != self.CLOSED:
+            self.state = self.CLOSED
+            logger.info("Circuit closed, LLM recovered.")
+            for listener in self._close_listeners:
+                listener()
+
+    def _record_failure(self, reason: str):
+        self._failures += 1
+        self._probe_in_flight = False
+        if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logger.warning("Circuit opened: %s", reason, extra={"failures": self._failures})
+            self.state = self.OPEN
+            self._opened_at = time.monotonic()
+
+    async def call(self, func: Callable[[], Awaitable[T]]) -> tuple[T, float]:
+        """Runs `func` through the breaker and returns (result, latency in seconds).
+
+        Raises CircuitOpenError without calling `func` while the circuit is open,
+        and re-raises errors and timeouts from `func` after recording them.
+        """
+        if not self.allow():
+            raise CircuitOpenError("LLM circuit is open")
+        started = time.monotonic()
+        try:
+            result = await asyncio.wait_for(func(), self.call_timeout)
+        except asyncio.TimeoutError:
+            self._record_failure(f"timeout after {self.call_timeout}s")
+            raise
+        except asyncio.CancelledError:
+            self._probe_in_flight = False
+            raise
+        except Exception as e:
+            self._record_failure(f"error: {e}")
+            raise
+        latency = time.monotonic() - started
+        if latency > self.latency_threshold:
+            # The answer is still usable, but the service is degrading
+            self._record_failure(f"slow response ({latency:.1f}s)")
+        else:
+            self._record_success()
+        return result, latency
+
+    @property
+    def is_closed(self) -> bool:
+        return self.state == self.CLOSED
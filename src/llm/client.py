@@ -1,5 +1,13 @@
+import asyncio
+import logging
+from dataclasses import dataclass
 import google.generativeai as genai
 from src import config
+from src.llm.breaker import CircuitBreaker, CircuitOpenError
+from src.llm.fallback import NaiveBayesClassifier
+from src.log import get_logger
+
+logger = get_logger("llm")
 
 def init_llm():
     if not config.GEMINI_API_KEY:
@@ -18,55 +26,112 @@ def init_llm():
 is_llm_enabled = init_llm()
 model = genai.GenerativeModel('models/gemini-2.0-flash') if is_llm_enabled else None
 
-async def is_task(text: str) -> bool:
-    """Uses LLM to determine if the message content is a task."""
-    if not model:
+breaker = CircuitBreaker(
+    failure_threshold=config.LLM_BREAKER_FAILURES,
+    latency_threshold=config.LLM_BREAKER_LATENCY,
+    reset_timeout=config.LLM_BREAKER_RESET,
+    call_timeout=config.LLM_TIMEOUT,
+)
+fallback_model = NaiveBayesClassifier.load(config.LLM_FALLBACK_MODEL)
+
+@dataclass(frozen=True)
+class Classification:
+    is_task: bool
+    # True when the fallback classifier answered because the LLM was unavailable
+    degraded: bool = False
+    # True when the fallback answered because the chat's LLM budget was used up
+    over_budget: bool = False
+    # True when the fallback answered because no Gemini API key is configured
+    llm_disabled: bool = False
+    # Gemini tokens spent on this message
+    tokens: int = 0
+
+    @property
+    def from_llm(self) -> bool:
+        """True when the verdict is the LLM's own rather than the fallback's."""
+        return not (self.degraded or self.over_budget or self.llm_disabled)
+
+def _token_count(response, prompt: str) -> int:
+    usage = getattr(response, "usage_metadata", None)
+    total = getattr(usage, "total_token_count", 0) if usage else 0
+    # Rough estimate when the response carries no usage data
+    return total or len(prompt) // 4 + 1
+
+async def ask_llm(text: str) -> tuple[bool, int]:
+    """Asks the LLM whether the text is a task. Returns the answer and the tokens used.
+
+    Goes through the circuit breaker: raises CircuitOpenError while Gemini is
+    considered down, and re-raises request errors and timeouts.
+    """
+    # More specific prompt to avoid misinterpreting commands and code blocks
+    prompt = f"""
+    Analyze the text to determine if it's a task. A task is a to-do item, a question needing an answer, or a request for action.
+    - A command starting with "/" is NOT a task.
+    - A simple statement or conversation is NOT a task.
+    - A block of code is NOT a task.
+    - A report, summary, or log entry is NOT a task.
+    
+    Respond with only "true" or "false".
+
+    Example 1:
+    Text: "Remember to buy milk tomorrow"
+    Response: "true"
+
+    Example 2:
+    Text: "/add_task buy milk"
+    Response: "false"
+
+    Example 3:
+    Text: "What is the capital of France?"
+    Response: "true"
+    
+    Example 4:
+    Text: "hello how are you"
+    Response: "false"
+
+    Example 5:
+    Text: "```python\\nprint('hello world')\\n```"
+    Response: "false"
+
+    Example 6:
+    Text: "06/25 Report"
+    Response: "false"
+
+    Text to analyze: "{text}"
+    """
+    response, latency = await breaker.call(lambda: model.generate_content_async(prompt))
+    latency_ms = round(latency * 1000, 1)
+
+    # Clean up the response and check for "true"
+    result = response.text.strip().lower()
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("LLM check for '%s...': %s", text[:30], result, extra={"latency_ms": latency_ms})
+    else:
+        logger.info("LLM check: %s", result, extra={"latency_ms": latency_ms})
+    return "true" in result, _token_count(response, prompt)
+
+def fallback_is_task(text: str) -> bool:
+    """Classifies with the offline model. Without a trained model nothing is a task."""
+    if fallback_model is None or not fallback_model.is_trained:
         return False
+    return fallback_model.predict(text)
 
-    try:
-        # More specific prompt to avoid misinterpreting commands and code blocks
-        prompt = f"""
-        Analyze the text to determine if it's a task. A task is a to-do item, a question needing an answer, or a request for action.
-        - A command starting with "/" is NOT a task.
-        - A simple statement or conversation is NOT a task.
-        - A block of code is NOT a task.
-        - A report, summary, or log entry is NOT a task.
-        
-        Respond with only "true" or "false".
-
-        Example 1:
-        Text: "Remember to buy milk tomorrow"
-        Response: "true"
-
-        Example 2:
-        Text: "/add_task buy milk"
-        Response: "false"
-
-        Example 3:
-        Text: "What is the capital of France?"
-        Response: "true"
-        
-        Example 4:
-        Text: "hello how are you"
-        Response: "false"
-
-        Example 5:
-        Text: "```python\\nprint('hello world')\\n```"
-        Response: "false"
-
-        Example 6:
-        Text: "06/25 Report"
-        Response: "false"
-
-        Text to analyze: "{text}"
-        """
-        response = await model.generate_content_async(prompt)
-        
-        # Clean up the response and check for "true"
-        result = response.text.strip().lower()
-        print(f"LLM check for '{text[:30]}...': {result}")
-        return "true" in result
+async def classify(text: str) -> Classification:
+    """Determines if the message content is a task, falling back to the local model if the LLM is unavailable."""
+    if not model:
+        return Classification(fallback_is_task(text), llm_disabled=True)
 
+    try:
+        is_task, tokens = await ask_llm(text)
+        return Classification(is_task, tokens=tokens)
+    except CircuitOpenError:
+        pass
+    except asyncio.TimeoutError:
+        logger.warning("LLM task check timed out after %ss.", config.LLM_TIMEOUT)
     except Exception as e:
-        print(f"🚨 ERROR in LLM task check: {e}")
-        return False 
\ No newline at end of file
+        logger.error("Error in LLM task check: %s", e)
+    return Classification(fallback_is_task(text), degraded=True)
+
+async def is_task(text: str) -> bool:
+    """Uses LLM to determine if the message content is a task."""
+    return (await classify(text)).is_task
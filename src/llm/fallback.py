@@ -0,0 +1,96 @@
+import json
+import math
+import re
+from collections import Counter
+from typing import Iterable, Optional
+
+from src.log import get_logger
+
+logger = get_logger("llm")
+
+_WORD_RE = re.compile(r"[a-z0-9_']+")
+_CJK_RE = re.compile(r"[\u3040-\u30ff\u3400-\u9fff\uf900-\ufaff]+")
+
+
+def tokenize(text: str) -> list[str]:
+    """Lowercased words, plus character unigrams and bigrams for CJK runs (no spaces there)."""
+    text = text.lower()
+    tokens = _WORD_RE.findall(text)
+    if text.lstrip().startswith("/"):
+        tokens.append("<command>")
+    if "```" in text:
+        tokens.append("<code>")
+    if "?" in text or "？" in text:
+        tokens.append("<question>")
+    for run in _CJK_RE.findall(text):
+        tokens.extend(run)
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+class NaiveBayesClassifier:
+    """Multinomial naive Bayes over message tokens, used while the LLM is unavailable."""
+
+    def __init__(self, class_counts: Optional[dict] = None, token_counts: Optional[dict] = None):
+        self.class_counts = {"1": 0, "0": 0, **(class_counts or {})}
+        self.token_counts = {"1": Counter(), "0": Counter()}
+        for label, counts in (token_counts or {}).items():
+            self.token_counts[label] = Counter(counts)
+        self._refresh()
+
+    def _refresh(self):
+        self._totals = {label: sum(counts.values()) for label, counts in self.token_counts.items()}
+        self._vocab_size = len(set(self.token_counts["1"]) | set(self.token_counts["0"])) or 1
+
+    @classmethod
+    def train(cls, samples: Iterable[tuple[str, bool]]) -> "NaiveBayesClassifier":
+        model = cls()
+        for text, is_task in samples:
+            label = "1" if is_task else "0"
+            model.class_counts[label] += 1
+            model.token_counts[label].update(tokenize(text))
+        model._refresh()
+        return model
+
+    @property
+    def is_trained(self) -> bool:
+        return self.class_counts["1"] > 0 and self.class_counts["0"] > 0
+
+    def probability(self, text: str) -> float:
+        """Probability that the text is a task."""
+        if not self.is_trained:
+            return 0.0
+        total = self.class_counts["1"] + self.class_counts["0"]
+        scores = {}
+        for label in ("1", "0"):
+            score = math.log(self.class_counts[label] / total)
+            denominator = self._totals[label] + self._vocab_size
+            counts = self.token_counts[label]
+            for token in tokenize(text):
+                score += math.log((counts.get(token, 0) + 1) / denominator)
+            scores[label] = score
+        # Softmax over the two log scores, computed stably
+        diff = scores["0"] - scores["1"]
+        return 1.0 / (1.0 + math.exp(min(diff, 700)))
+
+    def predict(self, text: str) -> bool:
+        return self.probability(text) >= 0.5
+
+    def save(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({
+                "class_counts": self.class_counts,
+                "token_counts": {label: dict(counts) for label, counts in self.token_counts.items()},
+            }, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["NaiveBayesClassifier"]:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.error("Could not load fallback model %s: %s", path, e)
+            return None
+        return cls(data.get("class_counts"), data.get("token_counts"))
@@ -0,0 +1,166 @@
+import datetime
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import threading
+import time
+from typing import Optional
+
+from src import config
+
+ROOT_LOGGER = "telehelper"
+
+# Attributes every LogRecord has; anything else was passed via `extra=` and is a structured field
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def get_logger(category: str) -> logging.Logger:
+    """Returns the logger for a category, e.g. get_logger("ingest")."""
+    return logging.getLogger(f"{ROOT_LOGGER}.{category}")
+
+
+def _category(record: logging.LogRecord) -> str:
+    return record.name[len(ROOT_LOGGER) + 1:] if record.name.startswith(f"{ROOT_LOGGER}.") else record.name
+
+
+def _fields(record: logging.LogRecord) -> dict:
+    return {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRS}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line with the structured fields passed via `extra=`."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(),
+            "level": record.levelname,
+            "category": _category(record),
+            "msg": record.getMessage(),
+        }
+        entry.update(_fields(record))
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Human-readable lines, with structured fields appended as key=value."""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s [%(category)s] %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        record.category = _category(record)
+        line = super().format(record)
+        fields = {k: v for k, v in _fields(record).items() if k != "category"}
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return line
+
+
+class CategoryFilter(logging.Filter):
+    """Per-category rate limiting (token bucket) and sampling.
+
+    Warnings and errors are never sampled, only rate limited. Dropped records
+    are counted and reported with the next record that gets through.
+    """
+
+    def __init__(self, categories: dict):
+        super().__init__()
+        self._rules = {
+            name: (float(rule.get("rate_limit", 0)), float(rule.get("sample", 1.0)))
+            for name, rule in (categories or {}).items()
+        }
+        self._buckets: dict[str, tuple[float, float]] = {}
+        self._dropped: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        category = _category(record)
+        rule = self._rules.get(category)
+        if rule is None:
+            return True
+        rate_limit, sample = rule
+
+        if record.levelno < logging.WARNING and sample < 1.0 and random.random() >= sample:
+            return False
+
+        with self._lock:
+            if rate_limit > 0:
+                now = time.monotonic()
+                tokens, last = self._buckets.get(category, (rate_limit, now))
+                tokens = min(rate_limit, tokens + (now - last) * rate_limit)
+                if tokens < 1:
+                    self._buckets[category] = (tokens, now)
+                    self._dropped[category] = self._dropped.get(category, 0) + 1
+                    return False
+                self._buckets[category] = (tokens - 1, now)
+            dropped = self._dropped.pop(category, 0)
+        if dropped:
+            record.dropped = dropped
+        return True
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records instead of blocking when the queue is full.
+
+    Dropped records are counted and reported with the next record that fits.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self._dropped = 0
+        self._dropped_lock = threading.Lock()
+
+    def enqueue(self, record: logging.LogRecord):
+        with self._dropped_lock:
+            dropped, self._dropped = self._dropped, 0
+        if dropped:
+            record.dropped = getattr(record, "dropped", 0) + dropped
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._dropped_lock:
+                self._dropped += 1 + dropped
+
+
+def setup_logging():
+    """Routes all telehelper loggers through a background queue listener.
+
+    Emitting a record only formats it and puts it on a queue; writing to stdout
+    happens on the listener thread so the event loop never blocks on I/O.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter() if config.LOG_FORMAT == "json" else TextFormatter())
+
+    log_queue: queue.Queue = queue.Queue(maxsize=config.LOG_QUEUE_SIZE)
+    handler = NonBlockingQueueHandler(log_queue)
+    handler.addFilter(CategoryFilter(config.LOG_CATEGORIES))
+
+    root = logging.getLogger(ROOT_LOGGER)
+    root.handlers[:] = [handler]
+    root.setLevel(config.LOG_LEVEL.upper())
+    root.propagate = False
+    for name, rule in (config.LOG_CATEGORIES or {}).items():
+        if "level" in rule:
+            get_logger(name).setLevel(str(rule["level"]).upper())
+
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+
+
+def shutdown_logging():
+    """Flushes queued records and stops the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
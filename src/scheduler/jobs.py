@@ -6,60 +6,117 @@ from src.context import database
 from typing import Optional
 import aiocron
 from src import config
+from src.bot import outbound
+from src.log import get_logger
+
+logger = get_logger("scheduler")
+
+_daily_summary_job: Optional[aiocron.Cron] = None
+
+def validate_cron(settings: config.Settings):
+    """Config validator: rejects a reload whose cron expression aiocron can't parse."""
+    aiocron.Cron(settings.daily_summary_cron, loop=asyncio.get_running_loop()).initialize()
+
+config.add_validator(validate_cron)
 
 async def send_daily_summary(user_client: TelegramClient, bot: Optional[Bot]):
     """Fetches pending tasks and sends a summary to the user via the notifier bot."""
-    print("Running daily summary job...")
+    logger.info("Running daily summary job...")
     try:
-        pending_tasks = await database.get_pending_tasks()
-
-        message_content = ""
-        if not pending_tasks:
-            message_content = f"🎉 {config.TELEGRAM_USER_NAME}，你今天沒有未處理事項，做得很好！"
-        else:
-            message_content = f"👋 {config.TELEGRAM_USER_NAME}，你今天還有 {len(pending_tasks)} 件未處理事項：\n\n"
-            for i, task in enumerate(pending_tasks, 1):
-                # Try to get chat title for context using the main client
+        lines = []
+        chat_titles = {}
+        async for task in database.iter_pending_summaries(preview_len=50):
+            # Try to get chat title for context using the main client
+            if task.chat_id not in chat_titles:
                 try:
-                    chat = await user_client.get_entity(task['chat_id'])
-                    chat_title = getattr(chat, 'title', '私訊')
+                    chat = await user_client.get_entity(task.chat_id)
+                    chat_titles[task.chat_id] = getattr(chat, 'title', '私訊')
                 except Exception:
-                    chat_title = f"未知對話 ({task['chat_id']})"
-                
-                # Use status to assign an icon
-                status_icon = "🔴" if task['status'] == 'new' else "🟡"
-                # Note: Markdown for PTB is slightly different, using `*bold*` instead of `**bold**`
-                message_content += f"{i}. {status_icon} *[{chat_title}]* {task['content'][:50]}...\n"
+                    chat_titles[task.chat_id] = f"未知對話 ({task.chat_id})"
             
+            # Use status to assign an icon
+            status_icon = "🔴" if task.status == 'new' else "🟡"
+            # Note: Markdown for PTB is slightly different, using `*bold*` instead of `**bold**`
+            lines.append(f"{len(lines) + 1}. {status_icon} *[{chat_titles[task.chat_id]}]* {task.preview}...\n")
+        pending_count = len(lines)
+
+        user_name = config.settings().telegram_user_name
+        message_content = ""
+        if not lines:
+            message_content = f"🎉 {user_name}，你今天沒有未處理事項，做得很好！"
+        else:
+            message_content = f"👋 {user_name}，你今天還有 {pending_count} 件未處理事項：\n\n" + "".join(lines)
             message_content += "\n你可以直接回覆此訊息 `/done <任務編號>` 來標記完成。"
         
         if bot: # Only send via bot if bot_client is available
-            await bot.send_message(
-                chat_id=config.NOTIFIER_TARGET_CHAT_ID,
-                text=message_content,
-                parse_mode='Markdown'
+            await outbound.send(
+                outbound.BOT,
+                config.NOTIFIER_TARGET_CHAT_ID,
+                message_content,
+                lambda text: bot.send_message(
+                    chat_id=config.NOTIFIER_TARGET_CHAT_ID,
+                    text=text,
+                    parse_mode='Markdown'
+                )
             )
-            print(f"Sent daily summary with {len(pending_tasks)} tasks via bot.")
+            logger.info("Queued daily summary with %d tasks via bot.", pending_count)
         else:
-            print("Notifier bot not available. Printing summary to console:")
-            print(message_content) # Fallback to console if bot is not active
-            print(f"Printed daily summary with {len(pending_tasks)} tasks to console.")
+            # Fallback to the log if bot is not active
+            logger.warning("Notifier bot not available. Daily summary with %d tasks:\n%s", pending_count, message_content)
 
     except Exception as e:
-        print(f"🚨 ERROR in send_daily_summary: {e}")
+        logger.error("Error in send_daily_summary: %s", e)
 
 async def run_scheduler(user_client: TelegramClient, bot: Optional[Bot]):
     """Runs the daily summary job at a fixed time every day using cron format."""
-    print(f"Scheduling daily summary with cron: {config.DAILY_SUMMARY_CRON}")
+    global _daily_summary_job
+    cron = config.settings().daily_summary_cron
+    logger.info("Scheduling daily summary with cron: %s", cron)
     
     # Schedule the daily summary task using aiocron
     # The function needs to be a partial to pass arguments to it
-    daily_summary_task = aiocron.crontab(
-        config.DAILY_SUMMARY_CRON,
+    _daily_summary_job = aiocron.crontab(
+        cron,
         func=send_daily_summary,
         args=(user_client, bot),
         start=True, # Start the cron job immediately
-        loop=asyncio.get_running_loop() # Ensure it runs on the current loop
+        loop=asyncio.get_running_loop(), # Ensure it runs on the current loop
+        tz=config.settings().tz() # Fire at the configured local time, not the host's
     )
-    print("Scheduler started. Waiting for cron job to trigger...")
-    # The scheduler runs indefinitely in the background, so no need for a while True loop here 
\ No newline at end of file
+
+    def reschedule(old: config.Settings, new: config.Settings):
+        """Moves the daily summary to the new cron expression after a config reload."""
+        global _daily_summary_job
+        if old.daily_summary_cron == new.daily_summary_cron and old.timezone == new.timezone:
+            return
+        try:
+            job = aiocron.crontab(
+                new.daily_summary_cron,
+                func=send_daily_summary,
+                args=(user_client, bot),
+                start=False,
+                loop=asyncio.get_running_loop(),
+                tz=new.tz()
+            )
+            job.start()
+        except Exception as e:
+            # Keep the old schedule rather than end up with none
+            logger.error("Could not reschedule daily summary with cron %s, keeping the previous schedule: %s",
+                         new.daily_summary_cron, e)
+            return
+        if _daily_summary_job:
+            _daily_summary_job.stop()
+        _daily_summary_job = job
+        logger.info("Rescheduled daily summary with cron: %s", new.daily_summary_cron)
+
+    config.on_reload(reschedule)
+    logger.info("Scheduler started. Waiting for cron job to trigger...")
+    # The scheduler runs indefinitely in the background, so no need for a while True loop here
+
+
+def stop_scheduler():
+    """Stops the daily summary cron so it can't fire during shutdown."""
+    global _daily_summary_job
+    if _daily_summary_job:
+        _daily_summary_job.stop()
+        _daily_summary_job = None
@@ -0,0 +1,8 @@
+import asyncio
+from src.ingest.worker import main
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except (KeyboardInterrupt, SystemExit):
+        print("Worker stopped.")